@@ -13,7 +13,6 @@ import koji
 import io
 import urllib
 import pathlib
-from future import standard_library
 from doozerlib import Runtime, state, cli as cli_package
 from doozerlib.distgit import ImageDistGitRepo
 from doozerlib.pushd import Dir
@@ -51,9 +50,6 @@ from numbers import Number
 from dockerfile_parse import DockerfileParser
 
 
-standard_library.install_aliases()
-
-
 class RemoteRequired(click.Option):
     """
     Option wrapper class for items that aren't needed for local
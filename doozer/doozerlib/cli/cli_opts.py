@@ -3,6 +3,12 @@ import io
 
 GLOBAL_OPT_DEFAULTS = {
     'distgit_threads': 20,
+    # Maximum number of concurrent requests (e.g. git ls-remote) made to upstream source repos
+    'fetch_concurrency': 8,
+    # git clone --filter spec (e.g. blob:none) used when cloning upstream sources. Empty for a full clone.
+    # Off by default: a partial clone fetches missing blobs during later git commands in the source dir,
+    # which run without the clone's retries and no-prompt environment.
+    'source_clone_filter': '',
     'rhpkg_clone_timeout': 900,
     'rhpkg_push_timeout': 1200,
 
@@ -1,14 +1,15 @@
 # This file is part of gitdata project <https://github.com/adammhaile/gitdata>
 # and released under LGPL v3 <https://www.gnu.org/licenses/lgpl-3.0.en.html>
 
-from future import standard_library
-standard_library.install_aliases()
 import yaml
 import logging
 import urllib.parse
 import os
 import shutil
 import io
+import json
+import hashlib
+import tempfile
 from . import exectools
 from .pushd import Dir
 from doozerlib import constants
@@ -16,6 +17,9 @@ from doozerlib import constants
 
 SCHEMES = ['ssh', 'ssh+git', "http", "https"]
 
+# Bump whenever the layout of parse cache entries changes; old entries are then ignored.
+PARSE_CACHE_VERSION = 2
+
 
 class GitDataException(Exception):
     """A broad exception for errors during GitData operations"""
@@ -57,7 +61,7 @@ class DataObj(object):
 
 class GitData(object):
     def __init__(self, data_path=None, clone_dir='./', commitish='master',
-                 sub_dir=None, exts=['yaml', 'yml', 'json'], reclone=False, logger=None):
+                 sub_dir=None, exts=['yaml', 'yml', 'json'], reclone=False, logger=None, parse_cache_dir=None):
         """
         Load structured data from a git source.
         :param str data_path: Git url (git/http/https) or local directory path
@@ -67,6 +71,8 @@ class GitData(object):
         :param list exts: List of valid extensions to search for in data, with out period
         :param reclone: If a clone is already present, remove it and reclone latest.
         :param logger: Python logging object to use
+        :param parse_cache_dir: If set, parsed YAML documents are cached as JSON in this directory
+                                (one entry per data file) so that later loads can skip the YAML parser.
         :raises GitDataException:
         """
         self.logger = logger
@@ -83,6 +89,9 @@ class GitData(object):
         self.commit_hash = None
         self.origin_url = None
         self.reclone = reclone
+        self.parse_cache_dir = parse_cache_dir
+        if parse_cache_dir:
+            self._prune_parse_cache()
         if data_path:
             self.clone_data(data_path)
 
@@ -224,7 +233,7 @@ class GitData(object):
                             except KeyError as e:
                                 self.logger.warning('{} contains template key `{}` but no value was provided'.format(data_file, e.args[0]))
                         try:
-                            data = yaml.full_load(raw_text)
+                            data = self._parse(raw_text, data_file)
                         except Exception as e:
                             raise ValueError(f"error parsing file {data_file}: {e}")
                         use = True
@@ -245,6 +254,63 @@ class GitData(object):
 
         return result
 
+    def _prune_parse_cache(self):
+        """
+        Removes parse cache entries written in a layout other than PARSE_CACHE_VERSION, which would never be read again.
+        """
+        try:
+            names = os.listdir(self.parse_cache_dir)
+        except OSError:
+            return  # nothing cached yet
+        for name in names:
+            if name.endswith('.json') and not name.startswith(f'v{PARSE_CACHE_VERSION}-'):
+                try:
+                    os.remove(os.path.join(self.parse_cache_dir, name))
+                except OSError:
+                    pass  # e.g. removed by a concurrent runtime sharing the directory
+
+    def _parse(self, raw_text, data_file):
+        """
+        Parses a YAML document. When a parse cache directory is configured, the result
+        is stored as JSON in a single entry per data_file, along with the hash of raw_text;
+        JSON loads considerably faster than YAML, so later runtimes sharing the directory
+        avoid the YAML parser while the file is unchanged. A changed file overwrites its
+        entry, so the cache does not grow as the data is updated.
+        Only documents which survive a JSON round trip unchanged are cached.
+        """
+        if not self.parse_cache_dir:
+            return yaml.full_load(raw_text)
+
+        digest = hashlib.sha256(raw_text.encode('utf-8')).hexdigest()
+        path_digest = hashlib.sha256(data_file.encode('utf-8')).hexdigest()
+        cache_file = os.path.join(self.parse_cache_dir, f'v{PARSE_CACHE_VERSION}-{path_digest}.json')
+        try:
+            with io.open(cache_file, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            if entry['digest'] == digest:
+                return entry['data']
+        except (OSError, ValueError, KeyError, TypeError):
+            pass  # not cached yet (or unreadable); parse the YAML
+
+        data = yaml.full_load(raw_text)
+        try:
+            serialized = json.dumps({'digest': digest, 'data': data})
+            if json.loads(serialized)['data'] != data:
+                return data  # e.g. non-string keys would not survive the round trip
+        except (TypeError, ValueError):
+            return data  # e.g. dates are not representable in JSON
+
+        try:
+            os.makedirs(self.parse_cache_dir, exist_ok=True)
+            # Write to a temp file and rename so concurrent readers never observe a partial entry
+            fd, tmp_path = tempfile.mkstemp(dir=self.parse_cache_dir, suffix='.tmp')
+            with io.open(fd, 'w', encoding='utf-8') as f:
+                f.write(serialized)
+            os.replace(tmp_path, cache_file)
+        except OSError as e:
+            self.logger.debug(f'Unable to write parse cache entry {cache_file}: {e}')
+        return data
+
     def commit(self, msg):
         """
         Commit outstanding data changes
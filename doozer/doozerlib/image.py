@@ -31,8 +31,7 @@ class ImageMetadata(Metadata):
         self.children = []  # list of ImageMetadata which use this image as a parent.
         self.dependencies: Set[str] = set()
         dependents = self.config.get('dependents', [])
-        for d in dependents:
-            dependent = self.runtime.late_resolve_image(d, add=True, required=False)
+        for dependent in self.runtime.late_resolve_images(dependents, add=True, required=False):
             if not dependent:
                 continue
             dependent.dependencies.add(self.distgit_key)
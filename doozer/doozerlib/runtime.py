@@ -1,11 +1,9 @@
-from future import standard_library
-
 import artcommonlib.util
 
-standard_library.install_aliases()
 from contextlib import contextmanager
-from collections import namedtuple
+from dataclasses import dataclass
 
+import asyncio
 import os
 import tempfile
 import shutil
@@ -14,17 +12,33 @@ import datetime
 import yaml
 import click
 import logging
+import logging.handlers
 import traceback
+import urllib.error
 import urllib.parse
+import urllib.request
 import signal
 import io
+import hashlib
+import queue
+import itertools
+import json
 import pathlib
-from typing import Optional, List, Dict, Tuple, Union
+from typing import Optional, List, Dict, Tuple, Union, Set, Iterable
 import time
 import re
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 from jira import JIRA
 
+try:
+    # Prefer the libyaml C bindings when available; they are drop-in compatible and much faster.
+    from yaml import CSafeLoader, CSafeDumper
+except ImportError:
+    from yaml import SafeLoader as CSafeLoader, SafeDumper as CSafeDumper
+
 from artcommonlib.runtime import GroupRuntime
 from doozerlib import gitdata
 from . import logutil
@@ -34,11 +48,13 @@ from . import dblib
 from .pushd import Dir
 
 from .image import ImageMetadata
+from .metadata import Metadata
 from .rpmcfg import RPMMetadata
 from doozerlib import state
 from .model import Model, Missing
 from multiprocessing import Lock, RLock, Semaphore
 from .repos import Repos
+from .repodata import RepodataLoader
 from doozerlib.exceptions import DoozerFatalError
 from doozerlib import constants
 from doozerlib import util
@@ -55,6 +71,35 @@ FREEZE_AUTOMATION_YES = 'yes'
 FREEZE_AUTOMATION_SCHEDULED = 'scheduled'  # inform the pipeline that only manually run tasks should be permitted
 FREEZE_AUTOMATION_NO = 'no'
 
+# Assembly names may only consist of alphanumerics, ., and _
+ASSEMBLY_NAME_PATTERN = re.compile(r'[\w.]+')
+
+# Separators accepted between entries of comma/space delimited CLI lists
+LIST_SEPARATOR_PATTERN = re.compile(r'[,\s]+')
+
+# scp-like git remotes (e.g. "git@github.com:openshift/origin.git"); groups are host and repo path without .git
+SSH_GIT_URL_PATTERN = re.compile(r'^git@([^:/]+)[:/](.+?)(?:\.git)?$')
+
+# A commit hash pinned in place of a branch name: hex digits, long enough to be sufficiently unique
+COMMIT_HASH_PATTERN = re.compile(r'[0-9a-fA-F]{7,}')
+
+# Accepted OCP version strings, e.g. v4 or v4.14; see Runtime.valid_version
+VERSION_PATTERN = re.compile(r'^v\d+((\.\d+)+)?$')
+
+# Group branches carrying a RHEL version, e.g. rhaos-4.14-rhel-9; groups are the text around the version
+EL_BRANCH_PATTERN = re.compile(r'^(.*)rhel-\d+(.*)$')
+
+# Strings export_sources can write as plain YAML scalars; anything else (or a YAML keyword) is written quoted
+YAML_PLAIN_SCALAR_PATTERN = re.compile(r'^[A-Za-z_/][\w./@+-]*$')
+YAML_RESERVED_SCALARS = frozenset(('y', 'n', 'yes', 'no', 'true', 'false', 'on', 'off', 'null'))
+
+# Source directories of failed clones are renamed to match this and deleted in the background
+FAILED_SOURCE_DIR_PATTERN = re.compile(r'\.failed\.\d+\.\d+$')
+
+# Metadata modes loaded with --load-wip / --load-disabled respectively
+WIP_LOAD_MODES = frozenset(('wip', 'enabled'))
+DISABLED_LOAD_MODES = frozenset(('enabled', 'disabled'))
+
 
 # doozer cancel brew builds on SIGINT (Ctrl-C)
 # but Jenkins sends a SIGTERM when cancelling a job.
@@ -70,6 +115,21 @@ def close_file(f):
     f.close()
 
 
+# Number of debug.log records buffered in memory between writes
+DEBUG_LOG_BUFFER_CAPACITY = 32
+
+# Minimum number of seconds between background fetches into the same --cache-dir git repo
+GIT_CACHE_FETCH_INTERVAL = 60
+
+
+def remove_dir_in_background(path):
+    """
+    Deletes a directory tree in a daemon thread so the caller does not wait on the I/O.
+    Trees left behind by an exiting process are swept up by the next runtime initialization.
+    """
+    threading.Thread(target=shutil.rmtree, args=(path,), kwargs={'ignore_errors': True}, daemon=True).start()
+
+
 def remove_tmp_working_dir(runtime):
     if runtime.remove_tmp_working_dir:
         shutil.rmtree(runtime.working_dir)
@@ -77,50 +137,65 @@ def remove_tmp_working_dir(runtime):
         click.echo("Temporary working directory preserved by operation: %s" % runtime.working_dir)
 
 
-# A named tuple for caching the result of Runtime._resolve_source.
-SourceResolution = namedtuple('SourceResolution', [
-    'source_path', 'url', 'branch', 'public_upstream_url', 'public_upstream_branch'
-])
+@dataclass(frozen=True)
+class SourceResolution:
+    """ Caches the result of Runtime.resolve_source. """
+    # Explicit __slots__ rather than dataclass(slots=True), which requires Python 3.10
+    __slots__ = ('source_path', 'url', 'branch', 'public_upstream_url', 'public_upstream_branch')
+    source_path: str
+    url: Optional[str]
+    branch: Optional[str]
+    public_upstream_url: Optional[str]
+    public_upstream_branch: Optional[str]
 
 
 class Runtime(GroupRuntime):
     # Use any time it is necessary to synchronize feedback from multiple threads.
+    # Kept reentrant, as image pushes hold it across the whole of push_image.
     mutex = RLock()
 
-    # Serialize access to the shared koji session
+    # Serialize access to the shared koji session. Reentrant by contract (see shared_koji_client_session).
     koji_lock = RLock()
 
-    # Build status detector lock
-    bs_lock = RLock()
+    # Build status detector lock. Never re-acquired by its holder, so a plain Lock suffices.
+    bs_lock = Lock()
 
-    # Serialize access to the console, and record log
+    # Serialize writes to record.log
     log_lock = Lock()
 
+    # Serialize the one-time load of image_name_map / name_in_bundle_map
+    name_map_lock = Lock()
+
+    # Immutable defaults in case no value is given. Kept on the class so that __init__ only
+    # needs to store the values actually passed in (or computed) on the instance.
+    verbose = False
+    quiet = False
+    load_wip = False
+    load_disabled = False
+    data_path = None
+    data_dir = None
+    latest_parent_version = False
+    rhpkg_config = None
+    db = None
+    brew_event = None
+    assembly_basis_event = None
+    assembly_type = None
+    releases_config = None
+    assembly = 'test'
+    disable_gssapi = False
+
     def __init__(self, **kwargs):
-        # initialize defaults in case no value is given
-        self.verbose = False
-        self.quiet = False
-        self.load_wip = False
-        self.load_disabled = False
-        self.data_path = None
-        self.data_dir = None
-        self.latest_parent_version = False
-        self.rhpkg_config = None
         self._koji_client_session = None
-        self.db = None
-        self.session_pool = {}
-        self.session_pool_available = {}
-        self.brew_event = None
-        self.assembly_basis_event = None
-        self.assembly_type = None
-        self.releases_config = None
-        self.assembly = 'test'
+        # See pooled_koji_client_session. Idle koji sessions available for reuse.
+        self._session_pool: queue.Queue = queue.Queue()
+        self._session_pool_size = 0  # Number of koji sessions created for the pool
+        self._session_pool_lock = Lock()  # guards _session_pool_size
         self._build_status_detector = None
-        self.disable_gssapi = False
         self._build_data_product_cache: Model = None
+        self._saved_state_hash: Optional[bytes] = None  # See save_state
 
         self.stream: List[str] = []  # Click option. A list of image stream overrides from the command line.
-        self.stream_overrides: Dict[str, str] = {}  # Dict of stream name -> pullspec from command line.
+        self.stream_overrides: Dict[str, Model] = {}  # Dict of stream name -> Model(image=pullspec from command line).
 
         self.upstreams: List[str] = []  # Click option. A list of upstream source commit to use.
         self.upstream_commitish_overrides: Dict[str, str] = {}  # Dict from distgit key name to upstream source commit to use.
@@ -128,17 +203,36 @@ class Runtime(GroupRuntime):
         self.downstreams: List[str] = []  # Click option. A list of distgit commits to checkout.
         self.downstream_commitish_overrides: Dict[str, str] = {}  # Dict from distgit key name to distgit commit to check out.
 
-        # See get_named_semaphore. The empty string key serves as a lock for the data structure.
-        self.named_semaphores = {'': Lock()}
+        # See get_named_semaphore.
+        self.named_semaphores: Dict[str, Semaphore] = {}
+        self._named_semaphores_lock = Lock()  # guards insertions into named_semaphores
+
+        # See git_clone. Maps --cache-dir git repo -> time.monotonic() of its last background fetch.
+        self._git_cache_last_fetch: Dict[str, float] = {}
+        self._git_cache_fetch_lock = Lock()
+
+        # See _list_remote_heads. Maps git url -> {branch name: commit hash}.
+        self._remote_heads_cache: Dict[str, Dict[str, str]] = {}
+        # See auto_version. Maps repo type -> detected version.
+        self._auto_version_cache: Dict[str, str] = {}
+
+        # See _load_gitdata. Maps load_data() arguments -> previously parsed result.
+        self._gitdata_cache = {}
+        # See get_group_config. Maps replace_vars -> group.yml content after template vars have been applied.
+        self._group_config_cache: Dict[str, Dict] = {}
+        # See _get_replace_vars. Maps (group, assembly) -> release name.
+        self._release_name_cache: Dict[Tuple[str, str], str] = {}
 
-        for key, val in kwargs.items():
-            self.__dict__[key] = val
+        self.__dict__.update(kwargs)
 
         if self.latest_parent_version:
             self.ignore_missing_base = True
 
         self._remove_tmp_working_dir = False
         self._group_config = None
+        # See get_public_upstream. Maps remote_git -> (public url, public branch). Cleared when group_config is set.
+        self._public_upstream_cache: Dict[str, Tuple[str, Optional[str]]] = {}
+        self._public_upstream_prefixes: Optional[List[Tuple[str, str, Optional[str]]]] = None
 
         self.cwd = os.getcwd()
 
@@ -165,9 +259,9 @@ class Runtime(GroupRuntime):
         # Maps component name to the Image or RPM Metadata responsible for the component
         self.component_map: Dict[str, Union[ImageMetadata, RPMMetadata]] = dict()
 
-        # Map of source code repo aliases (e.g. "ose") to a tuple representing the source resolution cache.
-        # See registry_repo.
-        self.source_resolutions = {}
+        # Map of source code repo aliases (e.g. "ose") to the SourceResolution cached for it.
+        # See register_source_alias.
+        self.source_resolutions: Dict[str, SourceResolution] = {}
 
         # Map of source code repo aliases (e.g. "ose") to a (public_upstream_url, public_upstream_branch) tuple.
         # See registry_repo.
@@ -187,10 +281,16 @@ class Runtime(GroupRuntime):
         # Used for image build ordering
         self.image_tree = {}
         self.image_order = []
-        # allows mapping from name or distgit to meta
-        self.image_name_map = {}
-        # allows mapping from name in bundle to meta
-        self.name_in_bundle_map: Dict[str, ImageMetadata] = {}
+        # See image_metas / ordered_image_metas. Cached views of image_map, reset by _invalidate_image_metas.
+        self._image_metas_cache: Optional[Tuple[ImageMetadata, ...]] = None
+        self._ordered_image_metas_cache: Optional[Tuple[ImageMetadata, ...]] = None
+        self._for_release_image_metas_cache: Optional[Tuple[ImageMetadata, ...]] = None
+        self._non_release_image_metas_cache: Optional[Tuple[ImageMetadata, ...]] = None
+        self._payload_image_metas_cache: Optional[Tuple[ImageMetadata, ...]] = None
+        # allows mapping from name or distgit to distgit key. Loaded on first access; see image_name_map.
+        self._image_name_map: Optional[Dict[str, str]] = None
+        # allows mapping from name in bundle to distgit key. Loaded on first access; see name_in_bundle_map.
+        self._name_in_bundle_map: Optional[Dict[str, str]] = None
 
         # holds untouched group config
         self.raw_group_config = {}
@@ -221,27 +321,55 @@ class Runtime(GroupRuntime):
         :param count: The number of times the lock can be claimed. Default=1, which is a full mutex.
         :return: A semaphore associated with the lock_name.
         """
-        with self.named_semaphores['']:
-            if is_dir:
-                p = '_dir::' + str(pathlib.Path(str(lock_name)).absolute())  # normalize (e.g. strip trailing /)
-            else:
-                p = lock_name
-            if p in self.named_semaphores:
-                return self.named_semaphores[p]
-            else:
-                new_semaphore = Semaphore(count)
-                self.named_semaphores[p] = new_semaphore
-                return new_semaphore
+        if is_dir:
+            p = '_dir::' + os.path.abspath(str(lock_name))  # normalize (e.g. strip trailing /)
+        else:
+            p = lock_name
+
+        # Fast path: semaphores are never removed, so an existing entry can be returned without locking.
+        semaphore = self.named_semaphores.get(p)
+        if semaphore is not None:
+            return semaphore
+
+        with self._named_semaphores_lock:
+            semaphore = self.named_semaphores.get(p)
+            if semaphore is None:  # check again now that we hold the lock
+                semaphore = Semaphore(count)
+                self.named_semaphores[p] = semaphore
+            return semaphore
+
+    def _load_gitdata(self, path='', key=None, keys=None, exclude=None, filter_funcs=None, replace_vars=None):
+        """
+        Memoizing wrapper around self.gitdata.load_data(). ocp-build-data does not change during the lifetime
+        of the runtime, so identical requests are served from the previously parsed result instead of
+        re-reading and re-parsing the YAML on disk.
+        """
+        replace_vars = replace_vars or {}
+        cache_key = (
+            path, key,
+            tuple(keys) if isinstance(keys, list) else keys,
+            tuple(exclude) if isinstance(exclude, list) else exclude,
+            tuple(filter_funcs) if isinstance(filter_funcs, list) else filter_funcs,
+            repr(sorted(replace_vars.items())),  # values may be unhashable
+        )
+        if cache_key in self._gitdata_cache:
+            return self._gitdata_cache[cache_key]
+
+        result = self.gitdata.load_data(path=path, key=key, keys=keys, exclude=exclude,
+                                        filter_funcs=filter_funcs, replace_vars=replace_vars)
+        self._gitdata_cache[cache_key] = result
+        return result
 
     def get_releases_config(self):
         if self.releases_config is not None:
             return self.releases_config
 
-        load = self.gitdata.load_data(key='releases')
+        load = self._load_gitdata(key='releases')
         data = load.data if load else {}
         if self.releases:  # override filename specified on command line.
             rcp = pathlib.Path(self.releases)
-            data = yaml.safe_load(rcp.read_text())
+            with rcp.open('rb') as f:  # let the parser consume the byte stream directly
+                data = yaml.load(f, Loader=CSafeLoader)
 
         if load:
             self.releases_config = Model(data)
@@ -257,25 +385,35 @@ class Runtime(GroupRuntime):
     @group_config.setter
     def group_config(self, config: Model):
         self._group_config = config
+        # public_upstreams may differ in the new config
+        self._public_upstream_prefixes = None
+        self._public_upstream_cache.clear()
 
     def get_group_config(self) -> Model:
         # group.yml can contain a `vars` section which should be a
         # single level dict containing keys to str.format(**dict) replace
         # into the YAML content. If `vars` found, the format will be
         # preformed and the YAML model will reloaded from that result
-        tmp_config = Model(self.gitdata.load_data(key='group').data)
-        replace_vars = self._get_replace_vars(tmp_config)
-        try:
-            group_yml = yaml.safe_dump(tmp_config.primitive(), default_flow_style=False)
-            raw_group_config = yaml.full_load(group_yml.format(**replace_vars))
-            tmp_config = Model(dict(raw_group_config))
-        except KeyError as e:
-            raise ValueError('group.yml contains template key `{}` but no value was provided'.format(e.args[0]))
+        tmp_config = Model(self._load_gitdata(key='group').data)
+        replace_vars = self._get_replace_vars(tmp_config).primitive()  # a plain dict, so that unknown keys raise KeyError
+        cache_key = repr(sorted(replace_vars.items()))
+        raw_group_config = self._group_config_cache.get(cache_key)
+        if raw_group_config is None:
+            try:
+                raw_group_config = tmp_config.primitive()
+                group_yml = yaml.dump(raw_group_config, Dumper=CSafeDumper, default_flow_style=False)
+                if '{' in group_yml or '}' in group_yml:  # otherwise formatting would not change anything
+                    raw_group_config = yaml.load(group_yml.format_map(replace_vars), Loader=CSafeLoader)
+            except KeyError as e:
+                raise ValueError('group.yml contains template key `{}` but no value was provided'.format(e.args[0]))
+            self._group_config_cache[cache_key] = raw_group_config
+        # Model only wraps (and never modifies) the cached dict, so each caller gets an independent view.
+        tmp_config = Model(dict(raw_group_config))
 
         return assembly_group_config(self.get_releases_config(), self.assembly, tmp_config)
 
     def get_errata_config(self, **kwargs):
-        return self.gitdata.load_data(key='erratatool', **kwargs).data
+        return self._load_gitdata(key='erratatool', **kwargs).data
 
     def _get_replace_vars(self, group_config: Model):
         replace_vars = group_config.vars or Model()
@@ -286,19 +424,29 @@ class Runtime(GroupRuntime):
         if self.assembly:
             replace_vars['runtime_assembly'] = self.assembly
             if self.assembly_type is not AssemblyTypes.STREAM:
-                replace_vars['release_name'] = util.get_release_name_for_assembly(self.group, self.get_releases_config(), self.assembly)
+                cache_key = (self.group, self.assembly)
+                release_name = self._release_name_cache.get(cache_key)
+                if release_name is None:
+                    release_name = util.get_release_name_for_assembly(self.group, self.get_releases_config(), self.assembly)
+                    self._release_name_cache[cache_key] = release_name
+                replace_vars['release_name'] = release_name
         return replace_vars
 
     def init_state(self):
         self.state = dict(state.TEMPLATE_BASE_STATE)
         if os.path.isfile(self.state_file):
             with io.open(self.state_file, 'r', encoding='utf-8') as f:
-                self.state = yaml.full_load(f)
+                self.state = yaml.load(f, Loader=CSafeLoader)
             self.state.update(state.TEMPLATE_BASE_STATE)
 
     def save_state(self):
+        state_yml = yaml.dump(self.state, Dumper=CSafeDumper, default_flow_style=False)
+        state_hash = hashlib.blake2b(state_yml.encode('utf-8')).digest()
+        if state_hash == self._saved_state_hash:
+            return  # unchanged since the last save; don't rewrite the file
         with io.open(self.state_file, 'w', encoding='utf-8') as f:
-            yaml.safe_dump(self.state, f, default_flow_style=False)
+            f.write(state_yml)
+        self._saved_state_hash = state_hash
 
     def initialize(self, mode='images', clone_distgits=True,
                    validate_content_sets=False,
@@ -333,8 +481,7 @@ class Runtime(GroupRuntime):
             atexit.register(remove_tmp_working_dir, self)
         else:
             self.working_dir = os.path.abspath(os.path.expanduser(self.working_dir))
-            if not os.path.isdir(self.working_dir):
-                os.makedirs(self.working_dir)
+            os.makedirs(self.working_dir, exist_ok=True)
 
         self.distgits_dir = os.path.join(self.working_dir, "distgits")
         self.distgits_diff_dir = os.path.join(self.working_dir, "distgits-diffs")
@@ -354,14 +501,15 @@ class Runtime(GroupRuntime):
                 if os.path.exists(path):
                     os.unlink(path)
 
-        if not os.path.isdir(self.distgits_dir):
-            os.mkdir(self.distgits_dir)
+        # brew_logs_dir: Directory where brew-logs will be downloaded after a build
+        # flags_dir: Directory for flags between invocations in the same working-dir
+        for path in (self.distgits_dir, self.distgits_diff_dir, self.sources_dir, self.brew_logs_dir, self.flags_dir):
+            os.makedirs(path, exist_ok=True)
 
-        if not os.path.isdir(self.distgits_diff_dir):
-            os.mkdir(self.distgits_diff_dir)
-
-        if not os.path.isdir(self.sources_dir):
-            os.mkdir(self.sources_dir)
+        # Clean up after failed clones whose background deletion did not finish before a previous run exited
+        for entry in os.listdir(self.sources_dir):
+            if FAILED_SOURCE_DIR_PATTERN.search(entry):
+                remove_dir_in_background(os.path.join(self.sources_dir, entry))
 
         if disabled is not None:
             self.load_disabled = disabled
@@ -410,19 +558,12 @@ class Runtime(GroupRuntime):
         self.record_log = io.open(self.record_log_path, 'a', encoding='utf-8')
         atexit.register(close_file, self.record_log)
 
-        # Directory where brew-logs will be downloaded after a build
-        if not os.path.isdir(self.brew_logs_dir):
-            os.mkdir(self.brew_logs_dir)
-
-        # Directory for flags between invocations in the same working-dir
-        if not os.path.isdir(self.flags_dir):
-            os.mkdir(self.flags_dir)
-
         if self.cache_dir:
             self.cache_dir = os.path.abspath(self.cache_dir)
 
         # get_releases_config also inits self.releases_config
-        self.assembly_type = assembly_type(self.get_releases_config(), self.assembly)
+        releases_config = self.get_releases_config()
+        self.assembly_type = assembly_type(releases_config, self.assembly)
 
         self.group_dir = self.gitdata.data_dir
         self.group_config = self.get_group_config()
@@ -430,7 +571,7 @@ class Runtime(GroupRuntime):
         self.hotfix = False  # True indicates builds should be tagged with associated hotfix tag for the artifacts branch
 
         if self.group_config.assemblies.enabled or self.enable_assemblies:
-            if re.fullmatch(r'[\w.]+', self.assembly) is None or self.assembly[0] == '.' or self.assembly[-1] == '.':
+            if ASSEMBLY_NAME_PATTERN.fullmatch(self.assembly) is None or self.assembly[0] == '.' or self.assembly[-1] == '.':
                 raise ValueError('Assembly names may only consist of alphanumerics, ., and _, but not start or end with a dot (.).')
         else:
             # If assemblies are not enabled for the group,
@@ -444,12 +585,12 @@ class Runtime(GroupRuntime):
             return
 
         # Read in the streams definition for this group if one exists
-        streams_data = self.gitdata.load_data(key='streams', replace_vars=replace_vars)
+        streams_data = self._load_gitdata(key='streams', replace_vars=replace_vars)
         if streams_data:
             org_stream_model = Model(dict_to_model=streams_data.data)
-            self.streams = assembly_streams_config(self.get_releases_config(), self.assembly, org_stream_model)
+            self.streams = assembly_streams_config(releases_config, self.assembly, org_stream_model)
 
-        self.assembly_basis_event = assembly_basis_event(self.get_releases_config(), self.assembly)
+        self.assembly_basis_event = assembly_basis_event(releases_config, self.assembly)
         if self.assembly_basis_event:
             if self.brew_event:
                 raise IOError(f'Cannot run with assembly basis event {self.assembly_basis_event} and --brew-event at the same time.')
@@ -471,17 +612,17 @@ class Runtime(GroupRuntime):
 
         # register the sources
         # For each "--source alias path" on the command line, register its existence with
-        # the runtime.
-        for r in self.source:
-            self.register_source_alias(r[0], r[1])
-
+        # the runtime. Entries in a --sources file take precedence over command line entries, and
+        # merging them first means an alias given in both places is only inspected once.
+        source_aliases = dict(self.source)
         if self.sources:
             with io.open(self.sources, 'r', encoding='utf-8') as sf:
-                source_dict = yaml.full_load(sf)
+                source_dict = yaml.load(sf, Loader=CSafeLoader)
                 if not isinstance(source_dict, dict):
                     raise ValueError('--sources param must be a yaml file containing a single dict.')
-                for key, val in source_dict.items():
-                    self.register_source_alias(key, val)
+                source_aliases.update(source_dict)
+        for alias, path in source_aliases.items():
+            self.register_source_alias(alias, path)
 
         with Dir(self.group_dir):
 
@@ -489,21 +630,17 @@ class Runtime(GroupRuntime):
             def flatten_list(names):
                 if not names:
                     return []
-                # split csv values
-                result = []
-                for n in names:
-                    result.append([x for x in n.replace(' ', ',').split(',') if x != ''])
-                # flatten result and remove dupes using set
-                return list(set([y for x in result for y in x]))
+                # split csv values in a single pass and remove dupes using set
+                return list({x for x in LIST_SEPARATOR_PATTERN.split(','.join(names)) if x})
 
             def filter_wip(n, d):
-                return d.get('mode', 'enabled') in ['wip', 'enabled']
+                return d.get('mode', 'enabled') in WIP_LOAD_MODES
 
             def filter_enabled(n, d):
                 return d.get('mode', 'enabled') == 'enabled'
 
             def filter_disabled(n, d):
-                return d.get('mode', 'enabled') in ['enabled', 'disabled']
+                return d.get('mode', 'enabled') in DISABLED_LOAD_MODES
 
             cli_arches_override = flatten_list(self.arches)
 
@@ -549,6 +686,9 @@ class Runtime(GroupRuntime):
                 # compile regexen and fail early if they don't
                 regexen = []
                 for val in scanner.matches:
+                    if isinstance(val, re.Pattern):  # already compiled by a previous pass
+                        regexen.append(val)
+                        continue
                     try:
                         regexen.append(re.compile(val))
                     except Exception as e:
@@ -575,40 +715,16 @@ class Runtime(GroupRuntime):
             else:
                 filter_func = filter_enabled
 
-            # pre-load the image data to get the names for all images
-            # eventually we can use this to allow loading images by
-            # name or distgit. For now this is used elsewhere
-            image_name_data = self.gitdata.load_data(path='images')
-
-            def _register_name_in_bundle(name_in_bundle: str, distgit_key: str):
-                if name_in_bundle in self.name_in_bundle_map:
-                    raise ValueError(f"Image {distgit_key} has name_in_bundle={name_in_bundle}, which is already taken by image {self.name_in_bundle_map[name_in_bundle]}")
-                self.name_in_bundle_map[name_in_bundle] = img.key
-
-            for img in image_name_data.values():
-                name = img.data.get('name')
-                short_name = name.split('/')[1]
-                self.image_name_map[name] = img.key
-                self.image_name_map[short_name] = img.key
-                name_in_bundle = img.data.get('name_in_bundle')
-                if name_in_bundle:
-                    _register_name_in_bundle(name_in_bundle, img.key)
-                else:
-                    short_name_without_ose = short_name[4:] if short_name.startswith("ose-") else short_name
-                    _register_name_in_bundle(short_name_without_ose, img.key)
-                    short_name_with_ose = "ose-" + short_name_without_ose
-                    _register_name_in_bundle(short_name_with_ose, img.key)
-
-            image_data = self.gitdata.load_data(path='images', keys=image_keys,
-                                                exclude=image_ex,
-                                                replace_vars=replace_vars,
-                                                filter_funcs=None if len(image_keys) else filter_func)
+            image_data = self._load_gitdata(path='images', keys=image_keys,
+                                            exclude=image_ex,
+                                            replace_vars=replace_vars,
+                                            filter_funcs=None if len(image_keys) else filter_func)
 
             try:
-                rpm_data = self.gitdata.load_data(path='rpms', keys=rpm_keys,
-                                                  exclude=rpm_ex,
-                                                  replace_vars=replace_vars,
-                                                  filter_funcs=None if len(rpm_keys) else filter_func)
+                rpm_data = self._load_gitdata(path='rpms', keys=rpm_keys,
+                                              exclude=rpm_ex,
+                                              replace_vars=replace_vars,
+                                              filter_funcs=None if len(rpm_keys) else filter_func)
             except gitdata.GitDataPathException:
                 # some older versions have no RPMs, that's ok.
                 rpm_data = {}
@@ -618,11 +734,17 @@ class Runtime(GroupRuntime):
                 raise DoozerFatalError('The following images or rpms were either missing or filtered out: {}'.format(', '.join(missed_include)))
 
             if mode in ['images', 'both']:
+                new_image_metas = []
                 for i in image_data.values():
                     if i.key not in self.image_map:
-                        metadata = ImageMetadata(self, i, self.upstream_commitish_overrides.get(i.key), clone_source=clone_source, prevent_cloning=prevent_cloning)
+                        # Sources are cloned below, concurrently, rather than by each constructor in turn
+                        metadata = ImageMetadata(self, i, self.upstream_commitish_overrides.get(i.key), clone_source=False, prevent_cloning=prevent_cloning)
                         self.image_map[metadata.distgit_key] = metadata
                         self.component_map[metadata.get_component_name()] = metadata
+                        new_image_metas.append(metadata)
+                if clone_source:
+                    self.prefetch_remote_heads(self._get_source_git_urls(new_image_metas))
+                    self.resolve_all_sources(new_image_metas)
                 if not self.image_map:
                     self.logger.warning("No image metadata directories found for given options within: {}".format(self.group_dir))
 
@@ -638,23 +760,32 @@ class Runtime(GroupRuntime):
                 self.generate_image_tree()
 
             if mode in ['rpms', 'both']:
+                new_rpm_metas = []
                 for r in rpm_data.values():
                     if clone_source is None:
                         # Historically, clone_source defaulted to True for rpms.
                         clone_source = True
-                    metadata = RPMMetadata(self, r, self.upstream_commitish_overrides.get(r.key), clone_source=clone_source, prevent_cloning=prevent_cloning)
+                    metadata = RPMMetadata(self, r, self.upstream_commitish_overrides.get(r.key), clone_source=False, prevent_cloning=prevent_cloning)
                     self.rpm_map[metadata.distgit_key] = metadata
                     self.component_map[metadata.get_component_name()] = metadata
+                    new_rpm_metas.append(metadata)
+                if clone_source:
+                    # Clone concurrently first; clone_source() then finds each source already resolved.
+                    self.prefetch_remote_heads(self._get_source_git_urls(new_rpm_metas))
+                    self.resolve_all_sources(new_rpm_metas)
+                    for metadata in new_rpm_metas:
+                        metadata.clone_source()
                 if not self.rpm_map:
                     self.logger.warning("No rpm metadata directories found for given options within: {}".format(self.group_dir))
 
         # Make sure that the metadata is not asking us to check out the same exact distgit & branch.
         # This would almost always indicate someone has checked in duplicate metadata into a group.
         no_collide_check = {}
-        for meta in list(self.rpm_map.values()) + list(self.image_map.values()):
+        for meta in itertools.chain(self.rpm_map.values(), self.image_map.values()):
             key = '{}/{}/#{}'.format(meta.namespace, meta.name, meta.branch())
-            if key in no_collide_check:
-                raise IOError('Complete duplicate distgit & branch; something wrong with metadata: {} from {} and {}'.format(key, meta.config_filename, no_collide_check[key].config_filename))
+            existing = no_collide_check.get(key)
+            if existing is not None:
+                raise IOError('Complete duplicate distgit & branch; something wrong with metadata: {} from {} and {}'.format(key, meta.config_filename, existing.config_filename))
             no_collide_check[key] = meta
 
         if clone_distgits:
@@ -708,7 +839,12 @@ class Runtime(GroupRuntime):
         # Add thread information for debug log
         debug_log_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s (%(thread)d) %(message)s'))
         debug_log_handler.setLevel(logging.DEBUG)
-        self.logger.addHandler(debug_log_handler)
+        # Concurrent builders log heavily at DEBUG; buffer a few records and write them out together.
+        # Anything at WARNING or above is written out immediately along with the records leading up to it,
+        # and logging.shutdown() writes out the rest at exit.
+        debug_log_buffer = logging.handlers.MemoryHandler(DEBUG_LOG_BUFFER_CAPACITY, flushLevel=logging.WARNING, target=debug_log_handler)
+        debug_log_buffer.setLevel(logging.DEBUG)
+        self.logger.addHandler(debug_log_buffer)
 
     def build_jira_client(self) -> JIRA:
         """
@@ -717,7 +853,7 @@ class Runtime(GroupRuntime):
         major, minor = self.get_major_minor_fields()
         if major == 4 and minor < 6:
             raise ValueError("ocp-build-data/bug.yml is not expected to be available for 4.X versions < 4.6")
-        bug_config = Model(self.gitdata.load_data(key='bug').data)
+        bug_config = Model(self._load_gitdata(key='bug').data)
         server = bug_config.jira_config.server or 'https://issues.redhat.com'
 
         token_auth = os.environ.get("JIRA_TOKEN")
@@ -739,7 +875,8 @@ class Runtime(GroupRuntime):
         """
         Context manager which offers a shared koji client session. You hold a koji specific lock in this context
         manager giving your thread exclusive access. The lock is reentrant, so don't worry about
-        call a method that acquires the same lock while you hold it.
+        call a method that acquires the same lock while you hold it. koji client sessions are not thread
+        safe, so the lock is needed for every use and not just for the one-time construction.
         Honors doozer --brew-event.
         Do not rerun gssapi_login on this client. We've observed client instability when this happens.
         """
@@ -754,7 +891,9 @@ class Runtime(GroupRuntime):
     @contextmanager
     def shared_build_status_detector(self) -> 'BuildStatusDetector':
         """
-        Yields a shared build status detector within context.
+        Yields a shared build status detector within context. You hold bs_lock in this context, giving
+        your thread exclusive access: the detector's koji session and caches are not thread safe, so
+        the lock cannot be skipped once the detector has been constructed.
         """
         with self.bs_lock:
             if self._build_status_detector is None:
@@ -772,26 +911,23 @@ class Runtime(GroupRuntime):
                         the global KojiWrapper cache. This is equivalent to passing
                         KojiWrapperOpts(caching=True) in each call within the session context.
         """
-        session = None
-        session_id = None
-        while True:
-            with self.mutex:
-                if len(self.session_pool_available) == 0:
-                    if len(self.session_pool) < 30:
-                        # pool has not grown to max size;
-                        new_session = self.build_retrying_koji_client()
-                        session_id = len(self.session_pool)
-                        self.session_pool[session_id] = new_session
-                        session = new_session  # This is what we wil hand to the caller
-                        break
-                    else:
-                        # Caller is just going to have to wait and try again
-                        pass
-                else:
-                    session_id, session = self.session_pool_available.popitem()
-                    break
-
-            time.sleep(5)
+        try:
+            session = self._session_pool.get_nowait()
+        except queue.Empty:
+            with self._session_pool_lock:
+                grow_pool = self._session_pool_size < 30
+                if grow_pool:  # pool has not grown to max size; reserve a slot for a new session
+                    self._session_pool_size += 1
+            if grow_pool:
+                try:
+                    session = self.build_retrying_koji_client()
+                except Exception:
+                    with self._session_pool_lock:
+                        self._session_pool_size -= 1
+                    raise
+            else:
+                # Block until another thread returns a session to the pool
+                session = self._session_pool.get()
 
         # Arriving here, we have a session to use.
         try:
@@ -800,12 +936,17 @@ class Runtime(GroupRuntime):
         finally:
             session.force_instance_caching = False
             # Put it back into the pool
-            with self.mutex:
-                self.session_pool_available[session_id] = session
+            self._session_pool.put(session)
 
     @staticmethod
     def timestamp():
-        return datetime.datetime.utcnow().isoformat()
+        """
+        :return: The current UTC time in the format of datetime.utcnow().isoformat(),
+                 formatted with time.gmtime/strftime rather than building a datetime.
+        """
+        seconds, micros = divmod(time.time_ns() // 1000, 1_000_000)
+        ts = time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(seconds))
+        return f'{ts}.{micros:06d}' if micros else ts  # isoformat() omits a zero fraction
 
     def assert_mutation_is_permitted(self):
         """
@@ -817,10 +958,33 @@ class Runtime(GroupRuntime):
             raise DoozerFatalError('Automation (builds / mutations) for this group is currently frozen (freeze_automation set to {}). Coordinate with the group owner to change this if you believe it is incorrect.'.format(FREEZE_AUTOMATION_YES))
 
     def image_metas(self) -> List[ImageMetadata]:
-        return list(self.image_map.values())
+        if self._image_metas_cache is None:
+            self._image_metas_cache = tuple(self.image_map.values())
+        return list(self._image_metas_cache)
 
     def ordered_image_metas(self) -> List[ImageMetadata]:
-        return [self.image_map[dg] for dg in self.image_order]
+        if self._ordered_image_metas_cache is None:
+            self._ordered_image_metas_cache = tuple(self.image_map[dg] for dg in self.image_order)
+        return list(self._ordered_image_metas_cache)
+
+    def _invalidate_image_metas(self):
+        """
+        Drops the cached views of image_map. Must be called whenever image_map or image_order change.
+        """
+        self._image_metas_cache = None
+        self._ordered_image_metas_cache = None
+        self._for_release_image_metas_cache = None
+        self._non_release_image_metas_cache = None
+        self._payload_image_metas_cache = None
+
+    def _partition_release_image_metas(self):
+        if self._for_release_image_metas_cache is None:
+            for_release = []
+            non_release = []
+            for meta in self.image_metas():
+                (for_release if meta.for_release else non_release).append(meta)
+            self._for_release_image_metas_cache = tuple(for_release)
+            self._non_release_image_metas_cache = tuple(non_release)
 
     def get_global_arches(self):
         """
@@ -837,13 +1001,50 @@ class Runtime(GroupRuntime):
         url = 'https://raw.githubusercontent.com/openshift-eng/ocp-build-data/main/product.yml'
         req = urllib.request.Request(url)
         req.add_header('Accept', 'application/yaml')
-        self._build_data_product_cache = Model(yaml.safe_load(exectools.urlopen_assert(req).read()))
+
+        # If --cache-dir is set, keep the last download along with its ETag so that an
+        # unchanged product.yml does not have to be transferred again.
+        cached_path = etag_path = None
+        if self.cache_dir:
+            product_cache_dir = os.path.join(self.cache_dir, self.user or "default", 'product')
+            cached_path = os.path.join(product_cache_dir, 'product.yml')
+            etag_path = cached_path + '.etag'
+            if os.path.isfile(cached_path) and os.path.isfile(etag_path):
+                with open(etag_path, 'r') as f:
+                    req.add_header('If-None-Match', f.read().strip())
+
+        try:
+            response = exectools.urlopen_assert(req)
+        except urllib.error.HTTPError as e:
+            if e.code != 304:
+                raise
+            self.logger.debug(f'{url} is unchanged; using {cached_path}')
+            with open(cached_path, 'rb') as f:
+                content = f.read()
+        else:
+            content = response.read()
+            etag = response.headers.get('ETag')
+            if cached_path and etag:
+                util.mkdirs(product_cache_dir)
+                with open(cached_path, 'wb') as f:
+                    f.write(content)
+                with open(etag_path, 'w') as f:
+                    f.write(etag)
+
+        self._build_data_product_cache = Model(yaml.load(content, Loader=CSafeLoader))
         return self._build_data_product_cache
 
     def filter_failed_image_trees(self, failed):
-        for i in self.ordered_image_metas():
-            if i.parent and i.parent.distgit_key in failed:
-                failed.append(i.distgit_key)
+        failed_set = set(failed)
+        # Repeat until nothing new fails: dependents can place a child ahead of its parent in the order
+        added = True
+        while added:
+            added = False
+            for i in self.ordered_image_metas():
+                if i.parent and i.parent.distgit_key in failed_set and i.distgit_key not in failed_set:
+                    failed_set.add(i.distgit_key)
+                    failed.append(i.distgit_key)
+                    added = True
 
         for f in failed:
             if f in self.image_map:
@@ -855,32 +1056,86 @@ class Runtime(GroupRuntime):
         return failed
 
     def generate_image_tree(self):
+        """
+        Populates self.image_tree (nested dicts of distgit keys, rooted at parentless images) and
+        self.image_order (distgit keys ordered by their lowest level in image_tree).
+        """
         self.image_tree = {}
-        image_lists = {0: []}
-
-        def add_child_branch(child, branch, level=1):
-            if level not in image_lists:
-                image_lists[level] = []
-            for sub_child in child.children:
-                if sub_child.distgit_key not in self.image_map:
-                    continue  # don't add images that have been filtered out
-                branch[sub_child.distgit_key] = {}
-                image_lists[level].append(sub_child.distgit_key)
-                add_child_branch(sub_child, branch[sub_child.distgit_key], level + 1)
-
-        for image in self.image_map.values():
-            if not image.parent:
-                self.image_tree[image.distgit_key] = {}
-                image_lists[0].append(image.distgit_key)
-                add_child_branch(image, self.image_tree[image.distgit_key])
-
-        levels = list(image_lists.keys())
-        levels.sort()
         self.image_order = []
-        for level in levels:
-            for i in image_lists[level]:
-                if i not in self.image_order:
-                    self.image_order.append(i)
+        self._invalidate_image_metas()
+        seen = set()
+        # Walk breadth first so that image_order comes out sorted by level
+        pending = deque((image, self.image_tree) for image in self.image_map.values() if not image.parent)
+        while pending:
+            image, branch = pending.popleft()
+            if image.distgit_key not in seen:  # an image with several parents is ordered at its first (lowest) level
+                seen.add(image.distgit_key)
+                self.image_order.append(image.distgit_key)
+            # but appears in the tree under each of its parents
+            branch[image.distgit_key] = sub_branch = {}
+            for child in image.children:
+                if child.distgit_key not in self.image_map:
+                    continue  # don't add images that have been filtered out
+                pending.append((child, sub_branch))
+
+    @property
+    def image_name_map(self) -> Dict[str, str]:
+        """
+        Maps the full and short name of every image in the group (regardless of mode or
+        --images / --exclude filtering) to its distgit key.
+        Loading requires parsing every image in the group, so it is deferred until first use.
+        """
+        return self._load_image_name_maps()[0]
+
+    @property
+    def name_in_bundle_map(self) -> Dict[str, str]:
+        """
+        Maps the name by which an image is referenced in operator bundles to its distgit key.
+        Loaded on first use; see image_name_map.
+        """
+        return self._load_image_name_maps()[1]
+
+    def _load_image_name_maps(self) -> Tuple[Dict[str, str], Dict[str, str]]:
+        """
+        :return: Returns image_name_map and name_in_bundle_map, loading them on first use.
+        """
+        if self._image_name_map is not None:
+            return self._image_name_map, self._name_in_bundle_map
+        if getattr(self, 'gitdata', None) is None:
+            # No group data available (yet); nothing to map. Not stored, so they load once initialize sets gitdata.
+            return {}, {}
+
+        with self.name_map_lock:
+            if self._image_name_map is not None:  # loaded by another thread while we waited
+                return self._image_name_map, self._name_in_bundle_map
+
+            # load the image data to get the names for all images
+            image_name_data = self._load_gitdata(path='images')
+            image_name_map = {}
+            name_in_bundle_map = {}
+
+            for img in image_name_data.values():
+                data = img.data
+                distgit_key = img.key
+                name = data.get('name')
+                short_name = name.split('/')[1]
+                image_name_map[name] = distgit_key
+                image_name_map[short_name] = distgit_key
+
+                name_in_bundle = data.get('name_in_bundle')
+                if name_in_bundle:
+                    bundle_names = (name_in_bundle,)
+                else:
+                    short_name_without_ose = short_name[4:] if short_name.startswith("ose-") else short_name
+                    bundle_names = (short_name_without_ose, "ose-" + short_name_without_ose)
+                for bundle_name in bundle_names:
+                    if bundle_name in name_in_bundle_map:
+                        raise ValueError(f"Image {distgit_key} has name_in_bundle={bundle_name}, which is already taken by image {name_in_bundle_map[bundle_name]}")
+                    name_in_bundle_map[bundle_name] = distgit_key
+
+            self._name_in_bundle_map = name_in_bundle_map
+            self._image_name_map = image_name_map  # assigned last; signals the maps are ready
+            return image_name_map, name_in_bundle_map
 
     def image_distgit_by_name(self, name):
         """Returns image meta by full name, short name, or distgit"""
@@ -897,31 +1152,36 @@ class Runtime(GroupRuntime):
         :return: Returns a list of ImageMetadata that are destined for the OCP release payload. Payload images must
                     follow the correct naming convention or an exception will be thrown.
         """
-        payload_images = []
-        for image_meta in self.image_metas():
-            if image_meta.is_payload:
-                """
-                <Tim Bielawa> note to self: is only for `ose-` prefixed images
-                <Clayton Coleman> Yes, Get with the naming system or get out of town
-                """
-                if not image_meta.image_name_short.startswith("ose-"):
-                    raise ValueError(f"{image_meta.distgit_key} does not conform to payload naming convention with image name: {image_meta.image_name_short}")
-
-                payload_images.append(image_meta)
-
-        return payload_images
+        if self._payload_image_metas_cache is None:
+            payload_images = []
+            for image_meta in self.image_metas():
+                if image_meta.is_payload:
+                    """
+                    <Tim Bielawa> note to self: is only for `ose-` prefixed images
+                    <Clayton Coleman> Yes, Get with the naming system or get out of town
+                    """
+                    if not image_meta.image_name_short.startswith("ose-"):
+                        raise ValueError(f"{image_meta.distgit_key} does not conform to payload naming convention with image name: {image_meta.image_name_short}")
+
+                    payload_images.append(image_meta)
+            # Only cached once every payload image has been validated
+            self._payload_image_metas_cache = tuple(payload_images)
+
+        return list(self._payload_image_metas_cache)
 
     def get_for_release_image_metas(self) -> List[ImageMetadata]:
         """
         :return: Returns a list of ImageMetada which are configured to be released by errata.
         """
-        return filter(lambda meta: meta.for_release, self.image_metas())
+        self._partition_release_image_metas()
+        return list(self._for_release_image_metas_cache)
 
     def get_non_release_image_metas(self) -> List[ImageMetadata]:
         """
         :return: Returns a list of ImageMetada which are not meant to be released by errata.
         """
-        return filter(lambda meta: not meta.for_release, self.image_metas())
+        self._partition_release_image_metas()
+        return list(self._non_release_image_metas_cache)
 
     def register_source_alias(self, alias, path):
         self.logger.info("Registering source alias %s: %s" % (alias, path))
@@ -937,14 +1197,9 @@ class Runtime(GroupRuntime):
                 origin_url = url
                 # Usually something like "git@github.com:openshift/origin.git"
                 # But we want an https hyperlink like http://github.com/openshift/origin
-                if origin_url.startswith("git@"):
-                    origin_url = origin_url[4:]  # remove git@
-                    origin_url = origin_url.replace(":", "/", 1)  # replace first colon with /
-
-                    if origin_url.endswith(".git"):
-                        origin_url = origin_url[:-4]  # remove .git
-
-                    origin_url = "https://%s" % origin_url
+                m = SSH_GIT_URL_PATTERN.match(origin_url)
+                if m:
+                    origin_url = f"https://{m.group(1)}/{m.group(2)}"
             else:
                 self.logger.error("Failed acquiring origin url for source alias %s: %s" % (alias, err_origin))
 
@@ -982,16 +1237,17 @@ class Runtime(GroupRuntime):
 
     def register_stream_override(self, name, image):
         self.logger.info("Registering image stream name override %s: %s" % (name, image))
-        self.stream_overrides[name] = image
+        # Wrapped once here, in the form resolve_stream returns
+        self.stream_overrides[name] = Model(dict_to_model={'image': image})
 
     @property
     def remove_tmp_working_dir(self):
         """
         Provides thread safe method of checking whether runtime should clean up the working directory.
+        A plain attribute is sufficient: loading/storing a bool on an object is atomic.
         :return: Returns True if the directory should be deleted
         """
-        with self.log_lock:
-            return self._remove_tmp_working_dir
+        return self._remove_tmp_working_dir
 
     @remove_tmp_working_dir.setter
     def remove_tmp_working_dir(self, remove):
@@ -999,8 +1255,7 @@ class Runtime(GroupRuntime):
         Provides thread safe method of setting whether runtime should clean up the working directory.
         :param remove: True if the directory should be removed. Only the last value set impacts the decision.
         """
-        with self.log_lock:
-            self._remove_tmp_working_dir = remove
+        self._remove_tmp_working_dir = remove
 
     def add_record(self, record_type, **kwargs):
         """
@@ -1018,18 +1273,20 @@ class Runtime(GroupRuntime):
         record_type|key1=value1|key2=value2|...|
         """
 
+        fields = [record_type]
+        for k, v in kwargs.items():
+            assert ("\n" not in k)  # kwargs keys are always str
+            # Make sure the values have no linefeeds as this would interfere with simple parsing.
+            v = str(v).replace("\n", " ;;; ").replace("\r", "")
+            fields.append(f"{k}={v}")
+
+        record = "|".join(fields) + "|\n"
+
         # Multiple image build processes could be calling us with action simultaneously, so
-        # synchronize output to the file.
+        # synchronize output to the file. Only the write is done under the lock; each record is
+        # flushed before returning, as record.log is read by other processes once doozer exits.
         with self.log_lock:
-            record = "%s|" % record_type
-            for k, v in kwargs.items():
-                assert ("\n" not in str(k))
-                # Make sure the values have no linefeeds as this would interfere with simple parsing.
-                v = str(v).replace("\n", " ;;; ").replace("\r", "")
-                record += "%s=%s|" % (k, v)
-
-            # Add the record to the file
-            self.record_log.write("%s\n" % record)
+            self.record_log.write(record)
             self.record_log.flush()
 
     def add_distgits_diff(self, distgit, diff):
@@ -1066,7 +1323,7 @@ class Runtime(GroupRuntime):
             return self.image_map[distgit_name]
 
         replace_vars = self._get_replace_vars(self.group_config).primitive()
-        data_obj = self.gitdata.load_data(path='images', key=distgit_name, replace_vars=replace_vars)
+        data_obj = self._load_gitdata(path='images', key=distgit_name, replace_vars=replace_vars)
         if not data_obj:
             raise DoozerFatalError('Unable to resolve image metadata for {}'.format(distgit_name))
 
@@ -1080,9 +1337,26 @@ class Runtime(GroupRuntime):
         meta = ImageMetadata(self, data_obj, self.upstream_commitish_overrides.get(data_obj.key))
         if add:
             self.image_map[distgit_name] = meta
+            self._invalidate_image_metas()
         self.component_map[meta.get_component_name()] = meta
         return meta
 
+    def late_resolve_images(self, distgit_names: List[str], add=False, required=True) -> List[Optional[ImageMetadata]]:
+        """Resolve several images at once; see late_resolve_image.
+        The metadata of images not yet in image_map is loaded from ocp-build-data in parallel.
+        :return: Image metas, in the order of distgit_names
+        """
+        missing = [name for name in distgit_names if name not in self.image_map]
+        if len(missing) > 1:
+            # Warm the _load_gitdata cache concurrently; loading is I/O and parse bound.
+            replace_vars = self._get_replace_vars(self.group_config).primitive()
+            exectools.parallel_exec(
+                lambda name, _: self._load_gitdata(path='images', key=name, replace_vars=replace_vars),
+                missing,
+                n_threads=min(len(missing), 16)).get()
+        # ImageMetadata construction resolves dependents and updates image_map, so it stays serial.
+        return [self.late_resolve_image(name, add=add, required=required) for name in distgit_names]
+
     def resolve_brew_image_url(self, image_name_and_version):
         """
         :param image_name_and_version: The image name to resolve. The image can contain a version tag or sha.
@@ -1090,22 +1364,22 @@ class Runtime(GroupRuntime):
         e.g. "openshift/jenkins:5"  => "registry-proxy.engineering.redhat.com/rh-osbs/openshift-jenkins:5"
         """
 
-        if self.group_config.urls.brew_image_host in image_name_and_version:
+        urls = self.group_config.urls
+        brew_image_host = urls.brew_image_host
+        if brew_image_host in image_name_and_version:
             # Seems like a full brew url already
             url = image_name_and_version
-        elif self.group_config.urls.brew_image_namespace is not Missing:
+        elif urls.brew_image_namespace is not Missing:
             # if there is a namespace, we need to flatten the image name.
             # e.g. openshift/image:latest => openshift-image:latest
             # ref: https://source.redhat.com/groups/public/container-build-system/container_build_system_wiki/pulling_pre_quay_switch_over_osbs_built_container_images_using_the_osbs_registry_proxy
-            url = self.group_config.urls.brew_image_host
-            ns = self.group_config.urls.brew_image_namespace
             name = image_name_and_version.replace('/', '-')
-            url = "/".join((url, ns, name))
+            url = f"{brew_image_host}/{urls.brew_image_namespace}/{name}"
         else:
             # If there is no namespace, just add the image name to the brew image host
-            url = "/".join((self.group_config.urls.brew_image_host, image_name_and_version))
+            url = f"{brew_image_host}/{image_name_and_version}"
 
-        if ':' not in url.split('/')[-1]:
+        if ':' not in url.rpartition('/')[2]:
             # oc image info will return information about all tagged images. So be explicit
             # in indicating :latest if there is no tag.
             url += ':latest'
@@ -1121,8 +1395,9 @@ class Runtime(GroupRuntime):
         """
 
         # If the stream has an override from the command line, return it.
-        if stream_name in self.stream_overrides:
-            return Model(dict_to_model={'image': self.stream_overrides[stream_name]})
+        override = self.stream_overrides.get(stream_name)
+        if override is not None:
+            return override
 
         if stream_name not in self.streams:
             raise IOError("Unable to find definition for stream: %s" % stream_name)
@@ -1151,34 +1426,41 @@ class Runtime(GroupRuntime):
                    applicable private repo replacement, remote_git will be returned (normalized to https).
             - branch: Optional public branch name if the public upstream source use a different branch name from the private upstream.
         """
+        # The result only depends on remote_git and public_upstreams, and the same few URLs are looked up
+        # for every image. Computing an entry twice under a race is harmless, so no lock is needed.
+        result = self._public_upstream_cache.get(remote_git)
+        if result is None:
+            result = self._public_upstream_cache[remote_git] = self._find_public_upstream(remote_git)
+        return result
+
+    def _find_public_upstream(self, remote_git: str) -> Tuple[str, Optional[str]]:
+        """ Uncached implementation of get_public_upstream. """
         remote_https = artcommonlib.util.convert_remote_git_to_https(remote_git)
 
-        if self.group_config.public_upstreams:
-
-            # We prefer the longest match in the mapping, so iterate through the entire
-            # map and keep track of the longest matching private remote.
-            target_priv_prefix = None
-            target_pub_prefix = None
-            target_pub_branch = None
-            for upstream in self.group_config.public_upstreams:
-                priv = upstream["private"]
-                pub = upstream["public"]
-                # priv can be a full repo, or an organization (e.g. git@github.com:openshift)
-                # It will be treated as a prefix to be replaced
-                https_priv_prefix = artcommonlib.util.convert_remote_git_to_https(priv)  # Normalize whatever is specified in group.yaml
-                https_pub_prefix = artcommonlib.util.convert_remote_git_to_https(pub)
-                if remote_https.startswith(f'{https_priv_prefix}/') or remote_https == https_priv_prefix:
-                    # If we have not set the prefix yet, or if it is longer than the current contender
-                    if not target_priv_prefix or len(https_priv_prefix) > len(target_pub_prefix):
-                        target_priv_prefix = https_priv_prefix
-                        target_pub_prefix = https_pub_prefix
-                        target_pub_branch = upstream.get("public_branch")
-
-            if target_priv_prefix:
-                return f'{target_pub_prefix}{remote_https[len(target_priv_prefix):]}', target_pub_branch
+        # Prefixes are ordered longest first, so the first match is the longest match in the mapping
+        for https_priv_prefix, https_pub_prefix, public_branch in self._get_public_upstream_prefixes():
+            if remote_https.startswith(f'{https_priv_prefix}/') or remote_https == https_priv_prefix:
+                return f'{https_pub_prefix}{remote_https[len(https_priv_prefix):]}', public_branch
 
         return remote_https, None
 
+    def _get_public_upstream_prefixes(self) -> List[Tuple[str, str, Optional[str]]]:
+        """
+        :return: Returns group_config.public_upstreams as (https private prefix, https public prefix, public branch)
+                 tuples, sorted by descending private prefix length. Computed once per group_config.
+        """
+        if self._public_upstream_prefixes is None:
+            prefixes = []
+            for upstream in self.group_config.public_upstreams or []:
+                # priv can be a full repo, or an organization (e.g. git@github.com:openshift)
+                # It will be treated as a prefix to be replaced. Normalize whatever is specified in group.yaml.
+                prefixes.append((artcommonlib.util.convert_remote_git_to_https(upstream["private"]),
+                                 artcommonlib.util.convert_remote_git_to_https(upstream["public"]),
+                                 upstream.get("public_branch")))
+            prefixes.sort(key=lambda prefix: len(prefix[0]), reverse=True)
+            self._public_upstream_prefixes = prefixes
+        return self._public_upstream_prefixes
+
     def git_clone(self, remote_url, target_dir, gitargs=None, set_env=None, timeout=0):
         gitargs = gitargs or []
         set_env = set_env or []
@@ -1192,33 +1474,28 @@ class Runtime(GroupRuntime):
             repo_dir = os.path.join(git_cache_dir, file_friendly_url)
             self.logger.info(f'Cache for {remote_url} going to {repo_dir}')
 
+            # The semaphore is only needed on a cache miss, so check without it first
             if not os.path.exists(repo_dir):
-                self.logger.info(f'Initializing cache directory for git remote: {remote_url}')
-
                 # If the cache directory for this repo does not exist yet, we will create one.
                 # But we must do so carefully to minimize races with any other doozer instance
                 # running on the machine.
                 with self.get_named_semaphore(repo_dir, is_dir=True):  # also make sure we cooperate with other threads in this process.
-                    tmp_repo_dir = tempfile.mkdtemp(dir=git_cache_dir)
-                    exectools.cmd_assert(f'git init --bare {tmp_repo_dir}')
-                    with Dir(tmp_repo_dir):
-                        exectools.cmd_assert(f'git remote add origin {remote_url}')
-
-                    try:
-                        os.rename(tmp_repo_dir, repo_dir)
-                    except:
-                        # There are two categories of failure
-                        # 1. Another doozer instance already created the directory, in which case we are good to go.
-                        # 2. Something unexpected is preventing the rename.
-                        if not os.path.exists(repo_dir):
-                            # Not sure why the rename failed. Raise to user.
-                            raise
+                    if not os.path.exists(repo_dir):  # another thread may have created it while we waited
+                        self._init_git_cache_repo(remote_url, git_cache_dir, repo_dir)
 
             # If we get here, we have a bare repo with a remote set
             # Pull content to update the cache. This should be safe for multiple doozer instances to perform.
-            self.logger.info(f'Updating cache directory for git remote: {remote_url}')
-            # Fire and forget this fetch -- just used to keep cache as fresh as possible
-            exectools.fire_and_forget(repo_dir, 'git fetch --all')
+            # Many images clone the same upstream within seconds of each other; one fetch per interval is enough.
+            now = time.monotonic()
+            with self._git_cache_fetch_lock:
+                last_fetch = self._git_cache_last_fetch.get(repo_dir)
+                fetch = last_fetch is None or now - last_fetch >= GIT_CACHE_FETCH_INTERVAL
+                if fetch:
+                    self._git_cache_last_fetch[repo_dir] = now
+            if fetch:
+                self.logger.info(f'Updating cache directory for git remote: {remote_url}')
+                # Fire and forget this fetch -- just used to keep cache as fresh as possible
+                exectools.fire_and_forget(repo_dir, 'git fetch --all')
             gitargs.extend(['--dissociate', '--reference-if-able', repo_dir])
 
         gitargs.append('--recurse-submodules')
@@ -1234,6 +1511,28 @@ class Runtime(GroupRuntime):
         cmd.append(target_dir)
         exectools.cmd_assert(cmd, retries=3, on_retry=["rm", "-rf", target_dir], set_env=set_env)
 
+    def _init_git_cache_repo(self, remote_url, git_cache_dir, repo_dir):
+        """
+        Creates a bare repo with remote_url as origin at repo_dir. The repo is prepared in a
+        temporary directory and renamed into place, so other doozer instances never see it half
+        initialized.
+        """
+        self.logger.info(f'Initializing cache directory for git remote: {remote_url}')
+        tmp_repo_dir = tempfile.mkdtemp(dir=git_cache_dir)
+        exectools.cmd_assert(f'git init --bare {tmp_repo_dir}')
+        exectools.cmd_assert(['git', '-C', tmp_repo_dir, 'remote', 'add', 'origin', remote_url])
+
+        try:
+            os.rename(tmp_repo_dir, repo_dir)
+        except OSError:
+            # There are two categories of failure
+            # 1. Another doozer instance already created the directory, in which case we are good to go.
+            # 2. Something unexpected is preventing the rename.
+            if not os.path.exists(repo_dir):
+                # Not sure why the rename failed. Raise to user.
+                raise
+            shutil.rmtree(tmp_repo_dir, ignore_errors=True)
+
     def is_branch_commit_hash(self, branch):
         """
         When building custom assemblies, it is sometimes useful to
@@ -1243,13 +1542,7 @@ class Runtime(GroupRuntime):
         :param branch: A branch name in rpm or image metadata.
         :returns: Returns True if the specified branch name is actually a commit hash for a custom assembly.
         """
-        if len(branch) >= 7:  # The hash must be sufficiently unique
-            try:
-                int(branch, 16)   # A hash must be a valid hex number
-                return True
-            except ValueError:
-                pass
-        return False
+        return COMMIT_HASH_PATTERN.fullmatch(branch) is not None
 
     def resolve_source(self, meta):
         """
@@ -1289,9 +1582,9 @@ class Runtime(GroupRuntime):
             return None
 
         self.logger.debug("Resolving local source directory for alias {}".format(alias))
-        if alias in self.source_resolutions:
-            path, _, _, meta.public_upstream_url, meta.public_upstream_branch = self.source_resolutions[alias]
-            self.logger.debug("returning previously resolved path for alias {}: {}".format(alias, path))
+        # Fast path: resolutions are never removed, so a registered alias can be returned without locking
+        path = self._get_resolved_source(alias, meta)
+        if path:
             return path
 
         # Where the source will land, check early so we know if old or new style
@@ -1305,10 +1598,10 @@ class Runtime(GroupRuntime):
 
         self.logger.debug("checking for source directory in source_dir: {}".format(source_dir))
 
+        # source_dir is unique to the alias, so threads resolving different aliases never wait on each other here
         with self.get_named_semaphore(source_dir, is_dir=True):
-            if alias in self.source_resolutions:  # we checked before, but check again inside the lock
-                path, _, _, meta.public_upstream_url, meta.public_upstream_branch = self.source_resolutions[alias]
-                self.logger.debug("returning previously resolved path for alias {}: {}".format(alias, path))
+            path = self._get_resolved_source(alias, meta)  # we checked before, but check again inside the lock
+            if path:
                 return path
 
             # If this source has already been extracted for this working directory
@@ -1316,13 +1609,13 @@ class Runtime(GroupRuntime):
                 # Store so that the next attempt to resolve the source hits the map
                 self.register_source_alias(alias, source_dir)
                 if self.group_config.public_upstreams:
-                    _, _, _, meta.public_upstream_url, meta.public_upstream_branch = self.source_resolutions[alias]
+                    resolution = self.source_resolutions[alias]
+                    meta.public_upstream_url, meta.public_upstream_branch = resolution.public_upstream_url, resolution.public_upstream_branch
                 self.logger.info("Source '{}' already exists in (skipping clone): {}".format(alias, source_dir))
                 if self.upcycle:
                     self.logger.info("Refreshing source for '{}' due to --upcycle: {}".format(alias, source_dir))
-                    with Dir(source_dir):
-                        exectools.cmd_assert('git fetch --all', retries=3)
-                        exectools.cmd_assert('git reset --hard @{upstream}', retries=3)
+                    exectools.cmd_assert(['git', '-C', source_dir, 'fetch', '--all'], retries=3)
+                    exectools.cmd_assert(['git', '-C', source_dir, 'reset', '--hard', '@{upstream}'], retries=3)
                 return source_dir
 
             if meta.prevent_cloning:
@@ -1342,12 +1635,16 @@ class Runtime(GroupRuntime):
                     gitargs = []
                 else:
                     gitargs = ['--no-single-branch', '--branch', clone_branch]
+                # A partial clone (e.g. blob:none) transfers commits and trees only; file contents of
+                # other branches and of history are fetched on demand if they are ever accessed.
+                clone_filter = self.global_opts['source_clone_filter']
+                if clone_filter:
+                    gitargs.append(f'--filter={clone_filter}')
 
                 self.git_clone(url, source_dir, gitargs=gitargs, set_env=constants.GIT_NO_PROMPTS)
 
                 if self.is_branch_commit_hash(branch=clone_branch):
-                    with Dir(source_dir):
-                        exectools.cmd_assert(f'git checkout {clone_branch}')
+                    exectools.cmd_assert(['git', '-C', source_dir, 'checkout', clone_branch])
 
                 # fetch public upstream source
                 if meta.public_upstream_branch:
@@ -1355,7 +1652,7 @@ class Runtime(GroupRuntime):
 
             except IOError as e:
                 self.logger.info("Unable to checkout branch {}: {}".format(clone_branch, str(e)))
-                shutil.rmtree(source_dir)
+                self._discard_source_dir(source_dir)
                 raise DoozerFatalError("Error checking out target branch of source '%s' in: %s" % (alias, source_dir))
 
             # Store so that the next attempt to resolve the source hits the map
@@ -1363,14 +1660,75 @@ class Runtime(GroupRuntime):
 
             if meta.commitish:
                 # With the alias registered, check out the commit we want
-                self.logger.info(f"Determining if commit-ish {meta.commitish} exists")
-                cmd = ["git", "-C", source_dir, "branch", "--contains", meta.commitish]
-                exectools.cmd_assert(cmd)
-                self.logger.info(f"Checking out commit-ish {meta.commitish}")
-                exectools.cmd_assert(["git", "-C", source_dir, "checkout", meta.commitish])
+                self._checkout_commitish(source_dir, meta.commitish)
 
             return source_dir
 
+    def _checkout_commitish(self, source_dir, commitish):
+        """
+        Checks out a commit-ish in a cloned source directory. A local branch name is checked out as
+        that branch, so HEAD keeps pointing at it; anything else leaves HEAD detached at the commit.
+        """
+        self.logger.info(f"Determining if commit-ish {commitish} exists")
+        # Fails if the commit-ish does not exist; a branch is always listed as containing itself
+        out, _ = exectools.cmd_assert(["git", "-C", source_dir, "branch", "--contains", commitish,
+                                       "--format=%(refname:short)"])
+        is_branch = commitish in out.splitlines()
+        self.logger.info(f"Checking out commit-ish {commitish}")
+        exectools.cmd_assert(["git", "-C", source_dir, "checkout"] + ([] if is_branch else ["--detach"]) + [commitish])
+
+    def _discard_source_dir(self, source_dir):
+        """
+        Moves a partially cloned source directory out of the way and deletes it in the background,
+        so that the clone error surfaces without waiting for a potentially large tree to be removed.
+        """
+        failed_dir = f'{source_dir}.failed.{os.getpid()}.{time.monotonic_ns()}'
+        try:
+            os.rename(source_dir, failed_dir)
+        except FileNotFoundError:
+            return  # the clone failed before creating anything
+        except OSError:
+            self.logger.warning(f'Unable to rename {source_dir}; removing it in place', exc_info=True)
+            shutil.rmtree(source_dir, ignore_errors=True)
+            return
+        remove_dir_in_background(failed_dir)
+
+    def _get_resolved_source(self, alias, meta) -> Optional[str]:
+        """
+        If alias has already been resolved, copies its public upstream information to meta.
+        :return: Returns the resolved source path, or None if alias has not been resolved yet.
+        """
+        resolution = self.source_resolutions.get(alias)
+        if resolution is None:
+            return None
+        meta.public_upstream_url, meta.public_upstream_branch = resolution.public_upstream_url, resolution.public_upstream_branch
+        self.logger.debug("returning previously resolved path for alias {}: {}".format(alias, resolution.source_path))
+        return resolution.source_path
+
+    def resolve_all_sources(self, metas: List[Metadata], n_threads: Optional[int] = None) -> List[Optional[str]]:
+        """
+        Calls resolve_source for each of the metas concurrently. Cloning is network and disk bound, and
+        resolve_source already serializes work on the same source directory.
+        :param metas: The metadata objects to resolve sources for.
+        :param n_threads: Maximum number of concurrent resolutions. Defaults to global_opts fetch_concurrency.
+        :return: Returns the source paths, in the order of metas.
+        """
+        if not metas:
+            return []
+        if n_threads is None:
+            n_threads = self.global_opts['fetch_concurrency']
+        # Created up front so that concurrent register_source_alias calls only ever add to it
+        self.state.setdefault('source_alias', {})
+
+        def _resolve(meta):
+            # Dir contexts are per thread; run as resolve_source does, within initialize's group_dir context
+            with Dir(self.group_dir):
+                return self.resolve_source(meta)
+
+        with util.timer(self.logger.info, f'Resolving sources of {len(metas)} components'):
+            with ThreadPoolExecutor(max_workers=min(n_threads, len(metas))) as executor:
+                return list(executor.map(_resolve, metas))
+
     def detect_remote_source_branch(self, source_details):
         """Find a configured source branch that exists, or raise DoozerFatalError. Returns branch name and git hash"""
         git_url = source_details["url"]
@@ -1418,16 +1776,87 @@ class Runtime(GroupRuntime):
         self.logger.info('Checking if target branch {} exists in {}'.format(branch, git_url))
 
         try:
-            out, _ = exectools.cmd_assert('git ls-remote --heads {} {}'.format(git_url, branch), retries=3)
+            heads = self._list_remote_heads(git_url)
         except Exception as err:
             # We don't expect and exception if the branch does not exist; just an empty string
             self.logger.error('Error attempting to find target branch {} hash: {}'.format(branch, err))
             return None
-        result = out.strip()  # any result means the branch is found; e.g. "7e66b10fbcd6bb4988275ffad0a69f563695901f	refs/heads/some_branch")
+        result = heads.get(branch)
         if not result and self.is_branch_commit_hash(branch):
             return branch  # It is valid hex; just return it
 
-        return result.split()[0] if result else None
+        return result
+
+    def _get_source_git_urls(self, metas: Iterable[Metadata]) -> Set[str]:
+        """
+        Determines which upstream sources resolve_source would have to clone for the given metadata.
+        :param metas: The metadata objects, with their assembly-merged config
+        :return: Returns the git urls of those sources.
+        """
+        urls = set()
+        for meta in metas:
+            source = meta.config.content.source
+            if not source or (self.local and meta.distgit_key in self.source_resolutions):
+                continue  # no source, or overridden with --source <distgit_key> path
+            # Mirrors the alias and source_dir naming in resolve_source
+            if 'git' in source:
+                url = source.git.url
+                name = os.path.splitext(os.path.basename(urllib.parse.urlparse(url).path))[0]
+                alias = f'{meta.namespace}_{meta.name}_{name}'
+                sub_path = alias
+            elif 'alias' in source:
+                alias = source.alias
+                url = self.group_config.sources[alias].url
+                sub_path = f'global_{alias}'
+            else:
+                continue
+            if url and alias not in self.source_resolutions and not os.path.isdir(os.path.join(self.sources_dir, sub_path)):
+                urls.add(url)
+        return urls
+
+    def prefetch_remote_heads(self, git_urls: Iterable[str], n_threads: Optional[int] = None):
+        """
+        Lists the branches of several remote repos concurrently, so that subsequent
+        detect_remote_source_branch calls for them are answered from the cache.
+        Failures are ignored here; they are reported when the branch is actually looked up.
+        :param git_urls: The URLs of the git repos to list.
+        :param n_threads: Number of concurrent ls-remote calls. Defaults to global_opts fetch_concurrency.
+        """
+        git_urls = [url for url in git_urls if url not in self._remote_heads_cache]
+        if not git_urls:
+            return
+        if n_threads is None:
+            n_threads = self.global_opts['fetch_concurrency']
+
+        def _list(url, _):
+            # Dir contexts are per thread; run as resolve_source does, within initialize's group_dir context
+            with Dir(self.group_dir):
+                try:
+                    self._list_remote_heads(url)
+                except Exception as err:
+                    self.logger.warning(f'Unable to list branches of {url}: {err}')
+
+        with util.timer(self.logger.info, f'Listing branches of {len(git_urls)} source repos'):
+            exectools.parallel_exec(_list, git_urls, n_threads=min(n_threads, len(git_urls))).get()
+
+    def _list_remote_heads(self, git_url) -> Dict[str, str]:
+        """
+        Lists the branches of a remote repo. The listing is fetched once per git_url, so checking
+        target, stage and fallback branches of the same repo costs a single network round trip.
+        :param git_url: The URL to the git repo to list.
+        :return: Returns a dict of branch name -> commit hash.
+        """
+        heads = self._remote_heads_cache.get(git_url)
+        if heads is None:
+            # Protocol v2 ls-refs lets the server send only refs/heads/* rather than every tag and pull ref
+            out, _ = exectools.cmd_assert(['git', '-c', 'protocol.version=2', 'ls-remote', '--heads', git_url], retries=3)
+            heads = {}
+            for line in out.splitlines():  # e.g. "7e66b10fbcd6bb4988275ffad0a69f563695901f	refs/heads/some_branch"
+                commit, _, ref = line.partition('\t')
+                if ref.startswith('refs/heads/'):
+                    heads[ref[len('refs/heads/'):]] = commit
+            self._remote_heads_cache[git_url] = heads
+        return heads
 
     def resolve_source_head(self, meta):
         """
@@ -1441,21 +1870,38 @@ class Runtime(GroupRuntime):
         if not source_dir:
             return None
 
-        with io.open(os.path.join(source_dir, '.git/HEAD'), encoding="utf-8") as f:
-            head_content = f.read().strip()
-            # This will either be:
-            # a SHA like: "52edbcd8945af0dc728ad20f53dcd78c7478e8c2"
-            # a local branch name like: "ref: refs/heads/master"
-            if head_content.startswith("ref:"):
-                return head_content.split('/', 2)[2]  # limit split in case branch name contains /
+        git_dir = os.path.join(source_dir, '.git')
+        if os.path.isfile(git_dir):
+            # Worktrees and submodules have a .git file pointing at the real git dir: "gitdir: <path>"
+            with open(git_dir, 'rb') as f:
+                git_dir = f.read().decode('utf-8').strip().split(':', 1)[1].strip()
+            git_dir = os.path.join(source_dir, git_dir)
 
-            # Otherwise, just return SHA
-            return head_content
+        with open(os.path.join(git_dir, 'HEAD'), 'rb') as f:
+            head_content = f.read(256).decode('ascii', 'replace').strip()
+
+        # This will either be:
+        # a SHA like: "52edbcd8945af0dc728ad20f53dcd78c7478e8c2"
+        # a local branch name like: "ref: refs/heads/master"
+        if head_content.startswith("ref:"):
+            return head_content.split('/', 2)[2]  # limit split in case branch name contains /
+
+        # Otherwise, just return SHA
+        return head_content
 
     def export_sources(self, output):
         self.logger.info('Writing sources to {}'.format(output))
         with io.open(output, 'w', encoding='utf-8') as sources_file:
-            yaml.dump({k: v.path for k, v in self.source_resolutions.items()}, sources_file, default_flow_style=False)
+            # Written line by line rather than through yaml.dump; keys stay sorted as yaml.dump would have them
+            for alias, resolution in sorted(self.source_resolutions.items()):
+                sources_file.write(f'{self._yaml_scalar(alias)}: {self._yaml_scalar(resolution.source_path)}\n')
+
+    @staticmethod
+    def _yaml_scalar(value) -> str:
+        value = str(value)
+        if YAML_PLAIN_SCALAR_PATTERN.match(value) and value.lower() not in YAML_RESERVED_SCALARS:
+            return value
+        return json.dumps(value)  # a JSON string is a valid double-quoted YAML scalar
 
     def auto_version(self, repo_type):
         """
@@ -1467,28 +1913,36 @@ class Runtime(GroupRuntime):
         rpms.  The caller must indicate which to use.
         """
 
+        version = self._auto_version_cache.get(repo_type)
+        if version:
+            return version
+
         repo_url = self.repos['rhel-server-ose-rpms'].baseurl(repo_type, 'x86_64')
         self.logger.info(
             "Getting version from atomic-openshift package in {}".format(
                 repo_url)
         )
 
-        # create a randomish repo name to avoid erroneous cache hits
-        repoid = "oit" + datetime.datetime.now().strftime("%s")
-        version_query = ["/usr/bin/repoquery", "--quiet", "--tempcache",
-                         "--repoid", repoid,
-                         "--repofrompath", repoid + "," + repo_url,
-                         "--queryformat", "%{VERSION}",
-                         "atomic-openshift"]
-        rc, auto_version, err = exectools.cmd_gather(version_query)
-        if rc != 0:
+        # Read the repo's primary metadata directly rather than having repoquery build a full temporary cache
+        try:
+            repodata = asyncio.run(RepodataLoader().load('rhel-server-ose-rpms', repo_url))
+        except Exception as e:
+            raise RuntimeError(
+                "Unable to get OCP version from RPM repository: {}".format(e)
+            )
+        latest = None
+        for rpm in repodata.primary_rpms:
+            if rpm.name == 'atomic-openshift' and (latest is None or rpm.compare(latest) > 0):
+                latest = rpm
+        if latest is None:
             raise RuntimeError(
-                "Unable to get OCP version from RPM repository: {}".format(err)
+                "Unable to get OCP version from RPM repository: atomic-openshift not found in {}".format(repo_url)
             )
 
-        version = "v" + auto_version.strip()
+        version = "v" + latest.version
 
         self.logger.info("Auto-detected OCP version: {}".format(version))
+        self._auto_version_cache[repo_type] = version
         return version
 
     def valid_version(self, version):
@@ -1502,7 +1956,7 @@ class Runtime(GroupRuntime):
         Not Valid:
           1, v1..2, av3.4, .v12  .99.12, v13-55
         """
-        return re.match(r"^v\d+((\.\d+)+)?$", version) is not None
+        return VERSION_PATTERN.match(version) is not None
 
     def clone_distgits(self, n_threads=None):
         with util.timer(self.logger.info, 'Full runtime clone'):
@@ -1532,7 +1986,10 @@ class Runtime(GroupRuntime):
         # a specific RHEL version. Pull apart the default group branch
         # and replace it wth the targeted version.
         el_ver: int = util.isolate_el_version_in_brew_tag(el_target)
-        match = re.match(r'^(.*)rhel-\d+(.*)$', self.branch)
+        match = EL_BRANCH_PATTERN.match(self.branch)
+        if not match:
+            # The group branch is not RHEL specific, so there is nothing to retarget
+            return self.branch
         el_specific_branch: str = f'{match.group(1)}rhel-{el_ver}{match.group(2)}'
         return el_specific_branch
 
@@ -1585,11 +2042,9 @@ class Runtime(GroupRuntime):
                  ).format(self.cfg_obj.full_path))
 
         self.gitdata = gitdata.GitData(data_path=self.data_path, clone_dir=self.working_dir,
-                                       commitish=self.group_commitish, reclone=self.upcycle, logger=self.logger)
+                                       commitish=self.group_commitish, reclone=self.upcycle, logger=self.logger,
+                                       parse_cache_dir=os.path.join(self.working_dir, 'gitdata-cache'))
         self.data_dir = self.gitdata.data_dir
 
     def get_rpm_config(self) -> dict:
-        config = {}
-        for key, val in self.rpm_map.items():
-            config[key] = val.raw_config
-        return config
+        return {key: val.raw_config for key, val in self.rpm_map.items()}
@@ -112,8 +112,10 @@ def setup_and_fetch_public_upstream_source(public_source_url: str, public_upstre
         exectools.cmd_assert(["git", "-C", source_dir, "remote", "add", "--", "public_upstream", public_source_url])
     else:
         exectools.cmd_assert(["git", "-C", source_dir, "remote", "set-url", "--", "public_upstream", public_source_url])
-    exectools.cmd_assert(["git", "-C", source_dir, "fetch", "--", "public_upstream", public_upstream_branch], retries=3,
-                         set_env=constants.GIT_NO_PROMPTS)
+    # Wire protocol v2 lets the server filter the advertised refs down to the requested branch,
+    # instead of sending every ref of (often very large) public repositories.
+    exectools.cmd_assert(["git", "-C", source_dir, "-c", "protocol.version=2", "fetch", "--", "public_upstream", public_upstream_branch],
+                         retries=3, set_env=constants.GIT_NO_PROMPTS)
 
 
 def is_commit_in_public_upstream(revision: str, public_upstream_branch: str, source_dir: str):
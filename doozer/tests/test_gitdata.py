@@ -0,0 +1,30 @@
+import os
+import tempfile
+import unittest
+
+from flexmock import flexmock
+from doozerlib import gitdata, logutil
+
+
+class TestGitData(unittest.TestCase):
+    def test_parse_cache(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            with open(os.path.join(cache_dir, "v1-0123abcd.json"), "w") as f:
+                f.write("{}")  # entry in an old layout
+            gd = gitdata.GitData(logger=logutil.getLogger(__name__), parse_cache_dir=cache_dir)
+            self.assertEqual(os.listdir(cache_dir), [])
+
+            self.assertEqual(gd._parse("a: 1\n", "/data/images/foo.yml"), {"a": 1})
+            self.assertEqual(gd._parse("a: 1\n", "/data/images/foo.yml"), {"a": 1})
+            self.assertEqual(gd._parse("a: 2\n", "/data/images/foo.yml"), {"a": 2})
+            self.assertEqual(len(os.listdir(cache_dir)), 1)  # a changed file replaces its entry
+            self.assertEqual(gd._parse("b: 1\n", "/data/images/bar.yml"), {"b": 1})
+            self.assertEqual(len(os.listdir(cache_dir)), 2)
+
+            gd = gitdata.GitData(logger=logutil.getLogger(__name__), parse_cache_dir=cache_dir)
+            flexmock(gitdata.yaml).should_receive("full_load").never()  # served from the cache
+            self.assertEqual(gd._parse("a: 2\n", "/data/images/foo.yml"), {"a": 2})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,13 @@
 #!/usr/bin/env python
+import io
+import os
+import tempfile
 import unittest
+import urllib.error
+import yaml
 from flexmock import flexmock
-from doozerlib import runtime, exectools, logutil, model
+from doozerlib import assembly, runtime, exectools, logutil, model
+from doozerlib.repodata import Repodata, Rpm
 
 
 def stub_runtime():
@@ -19,15 +25,17 @@ def stub_runtime():
 class RuntimeTestCase(unittest.TestCase):
     def test_get_remote_branch_ref(self):
         rt = stub_runtime()
-        flexmock(exectools).should_receive("cmd_assert").once().and_return("spam", "")
+        flexmock(exectools).should_receive("cmd_assert").once().and_return("spam\trefs/heads/branch\neggs\trefs/heads/feature/branch\n", "")
         res = rt._get_remote_branch_ref("giturl", "branch")
         self.assertEqual(res, "spam")
+        self.assertEqual(rt._get_remote_branch_ref("giturl", "feature/branch"), "eggs")  # served from the cached listing
+        self.assertIsNone(rt._get_remote_branch_ref("giturl", "other"))
 
         flexmock(exectools).should_receive("cmd_assert").once().and_return("", "")
-        self.assertIsNone(rt._get_remote_branch_ref("giturl", "branch"))
+        self.assertIsNone(rt._get_remote_branch_ref("giturl2", "branch"))
 
         flexmock(exectools).should_receive("cmd_assert").once().and_raise(Exception("whatever"))
-        self.assertIsNone(rt._get_remote_branch_ref("giturl", "branch"))
+        self.assertIsNone(rt._get_remote_branch_ref("giturl3", "branch"))
 
     def test_detect_remote_source_branch(self):
         rt = stub_runtime()
@@ -67,6 +75,322 @@ class RuntimeTestCase(unittest.TestCase):
         with self.assertRaises(runtime.DoozerFatalError):
             rt.detect_remote_source_branch(source_details)
 
+    def test_is_branch_commit_hash(self):
+        rt = stub_runtime()
+        self.assertTrue(rt.is_branch_commit_hash("1234abc"))
+        self.assertTrue(rt.is_branch_commit_hash("0f3C5e1a9b2d4c6e8f0a1b3c5d7e9f1a3b5c7d9e"))
+        self.assertFalse(rt.is_branch_commit_hash("abc123"))  # too short
+        self.assertFalse(rt.is_branch_commit_hash("release-4.14"))
+        self.assertFalse(rt.is_branch_commit_hash("0xabcdef1"))
+
+    def test_timestamp(self):
+        flexmock(runtime.time).should_receive("time_ns").and_return(1700000000123456789).and_return(1700000000000000999)
+        self.assertEqual(runtime.Runtime.timestamp(), "2023-11-14T22:13:20.123456")
+        self.assertEqual(runtime.Runtime.timestamp(), "2023-11-14T22:13:20")
+
+    def test_prefetch_remote_heads(self):
+        rt = stub_runtime()
+        rt.local = False
+        rt.global_opts = {"fetch_concurrency": 2}
+        rt.group_dir = "/tmp/ocp-build-data"
+        rt.group_config = model.Model({"sources": {"ose": {"url": "git@github.com:openshift-priv/ose.git"}}})
+        releases_config = model.Model({"releases": {"art1": {"assembly": {"members": {"images": [
+            {"distgit_key": "foo", "metadata": {"content": {"source": {"git": {"url": "git@github.com:openshift-priv/foo-fork.git"}}}}},
+        ]}}}}})
+
+        def meta(key, config):
+            # meta.config is what resolve_source reads: the file-based config merged with assembly overrides
+            config = assembly.assembly_metadata_config(releases_config, "art1", "image", key, model.Model(config))
+            return flexmock(distgit_key=key, namespace="containers", name=key.split(".")[0], config=config)
+
+        metas = [
+            meta("foo", {"content": {"source": {"git": {"url": "git@github.com:openshift-priv/foo.git"}}}}),
+            meta("bar.apb", {"content": {"source": {"git": {"url": "git@github.com:openshift-priv/bar.git"}}}}),
+            meta("baz", {"content": {"source": {"alias": "ose"}}}),
+            meta("nosource", {}),
+        ]
+        with tempfile.TemporaryDirectory() as sources_dir:
+            rt.sources_dir = sources_dir
+            os.mkdir(os.path.join(sources_dir, "containers_bar_bar"))  # already cloned
+            urls = rt._get_source_git_urls(metas)
+        self.assertEqual(urls, {"git@github.com:openshift-priv/foo-fork.git", "git@github.com:openshift-priv/ose.git"})
+
+        flexmock(exectools).should_receive("cmd_assert").with_args(["git", "-c", "protocol.version=2", "ls-remote", "--heads", "git@github.com:openshift-priv/foo-fork.git"], retries=3).once().and_return("abc\trefs/heads/main\n", "")
+        flexmock(exectools).should_receive("cmd_assert").with_args(["git", "-c", "protocol.version=2", "ls-remote", "--heads", "git@github.com:openshift-priv/ose.git"], retries=3).once().and_raise(Exception("boom"))
+        rt.prefetch_remote_heads(urls)
+        self.assertEqual(rt._get_remote_branch_ref("git@github.com:openshift-priv/foo-fork.git", "main"), "abc")
+
+    def test_valid_version(self):
+        rt = stub_runtime()
+        for version in ("v1", "v12", "v3.4", "v2.12.0"):
+            self.assertTrue(rt.valid_version(version), version)
+        for version in ("1", "v1..2", "av3.4", ".v12", "v13-55"):
+            self.assertFalse(rt.valid_version(version), version)
+
+    def test_resolve_all_sources(self):
+        rt = stub_runtime()
+        rt.global_opts = {"fetch_concurrency": 4}
+        rt.group_dir = "/tmp/ocp-build-data"
+        rt.state = {}
+        metas = [flexmock(distgit_key=f"image{i}") for i in range(10)]
+        flexmock(rt).should_receive("resolve_source").replace_with(lambda meta: f"/sources/{meta.distgit_key}").times(10)
+        self.assertEqual(rt.resolve_all_sources(metas), [f"/sources/image{i}" for i in range(10)])
+        self.assertEqual(rt.resolve_all_sources([]), [])
+
+        flexmock(rt).should_receive("resolve_source").and_raise(runtime.DoozerFatalError("clone failed"))
+        with self.assertRaises(runtime.DoozerFatalError):
+            rt.resolve_all_sources(metas)
+
+    def test_resolve_all_sources_registers_aliases(self):
+        rt = stub_runtime()
+        rt.global_opts = {"fetch_concurrency": 8}
+        rt.group_dir = "/tmp/ocp-build-data"
+        rt.state = {}
+        rt.record_log = io.StringIO()
+        metas = [flexmock(distgit_key=f"image{i}") for i in range(16)]
+        flexmock(exectools).should_receive("cmd_gather").and_return((1, "", "not a git repo"))
+        cwds = []
+
+        def resolve_source(meta):
+            cwds.append(runtime.Dir.getcwd())
+            rt.register_source_alias(meta.distgit_key, source_dir)
+            return source_dir
+
+        flexmock(rt).should_receive("resolve_source").replace_with(resolve_source)
+        with tempfile.TemporaryDirectory() as source_dir:
+            rt.resolve_all_sources(metas)
+        self.assertEqual(set(rt.state["source_alias"]), {meta.distgit_key for meta in metas})
+        self.assertEqual(set(cwds), {"/tmp/ocp-build-data"})
+
+    def test_auto_version(self):
+        rt = stub_runtime()
+        rt.repos = {"rhel-server-ose-rpms": flexmock(baseurl=lambda repo_type, arch: "https://example.com/ose/")}
+        repodata = Repodata(name="rhel-server-ose-rpms", primary_rpms=[
+            Rpm.from_nevra("atomic-openshift-0:3.11.10-1.el7.x86_64"),
+            Rpm.from_nevra("atomic-openshift-0:3.11.100-1.el7.x86_64"),
+            Rpm.from_nevra("atomic-openshift-0:3.11.99-1.el7.x86_64"),
+            Rpm.from_nevra("bash-0:5.0.0-1.el7.x86_64"),
+        ])
+
+        async def load(repo_name, repo_url):
+            self.assertEqual(repo_url, "https://example.com/ose/")
+            return repodata
+
+        flexmock(runtime.RepodataLoader).should_receive("load").replace_with(load).once()
+        self.assertEqual(rt.auto_version("unsigned"), "v3.11.100")
+        self.assertEqual(rt.auto_version("unsigned"), "v3.11.100")  # memoized per repo type
+
+        repodata.primary_rpms = repodata.primary_rpms[3:]
+        flexmock(runtime.RepodataLoader).should_receive("load").replace_with(load).once()
+        with self.assertRaises(RuntimeError):
+            rt.auto_version("signed")
+
+    def test_load_gitdata_cached(self):
+        rt = stub_runtime()
+        rt.gitdata = flexmock()
+        rt.gitdata.should_receive("load_data").with_args(path='', key='group', keys=None, exclude=None,
+                                                         filter_funcs=None, replace_vars={}).once().and_return("group")
+        rt.gitdata.should_receive("load_data").with_args(path='images', key=None, keys=None, exclude=None,
+                                                         filter_funcs=None, replace_vars={"MAJOR": 4}).once().and_return("images")
+        self.assertEqual(rt._load_gitdata(key='group'), "group")
+        self.assertEqual(rt._load_gitdata(key='group'), "group")
+        self.assertEqual(rt._load_gitdata(path='images', replace_vars={"MAJOR": 4}), "images")
+        self.assertEqual(rt._load_gitdata(path='images', replace_vars={"MAJOR": 4}), "images")
+
+    def test_image_name_map(self):
+        rt = stub_runtime()
+        self.assertEqual(rt.image_name_map, {})  # no group data yet
+        rt.gitdata = flexmock()
+        rt.gitdata.should_receive("load_data").once().and_return({
+            "ose-foo": flexmock(key="ose-foo", data={"name": "openshift/ose-foo"}),
+            "bar": flexmock(key="bar", data={"name": "openshift/bar", "name_in_bundle": "bar-bundled"}),
+        })
+        self.assertEqual(rt.image_name_map, {"openshift/ose-foo": "ose-foo", "ose-foo": "ose-foo", "openshift/bar": "bar", "bar": "bar"})
+        self.assertEqual(rt.name_in_bundle_map, {"foo": "ose-foo", "ose-foo": "ose-foo", "bar-bundled": "bar"})
+
+    def test_add_record(self):
+        rt = stub_runtime()
+        rt.record_log = io.StringIO()
+        flexmock(rt.record_log).should_call("flush").twice()  # nothing is left buffered when add_record returns
+        rt.add_record("build", distgit="foo", message="line1\nline2")
+        rt.add_record("push", status=0)
+        self.assertEqual(rt.record_log.getvalue(), "build|distgit=foo|message=line1 ;;; line2|\npush|status=0|\n")
+
+    def test_get_public_upstream(self):
+        rt = stub_runtime()
+        rt.group_config = model.Model({"public_upstreams": [
+            {"private": "git@github.com:openshift-priv", "public": "https://github.com/openshift"},
+            {"private": "https://github.com/openshift-priv/kubernetes", "public": "https://github.com/kubernetes/kubernetes", "public_branch": "master"},
+        ]})
+        self.assertEqual(rt.get_public_upstream("git@github.com:openshift-priv/foo.git"), ("https://github.com/openshift/foo", None))
+        self.assertEqual(rt.get_public_upstream("https://github.com/openshift-priv/kubernetes"), ("https://github.com/kubernetes/kubernetes", "master"))
+        self.assertEqual(rt.get_public_upstream("https://github.com/openshift-privileged/foo"), ("https://github.com/openshift-privileged/foo", None))
+
+        # The longest private prefix wins, regardless of the length of the public replacement
+        rt.group_config = model.Model({"public_upstreams": [
+            {"private": "https://github.com/priv", "public": "https://github.com/a-rather-long-public-organization"},
+            {"private": "https://github.com/priv/repo", "public": "https://github.com/pub/repo"},
+        ]})
+        self.assertEqual(rt.get_public_upstream("https://github.com/priv/repo"), ("https://github.com/pub/repo", None))
+
+        # Setting a new group config must not serve results computed for the old one
+        rt.group_config = model.Model()
+        self.assertEqual(rt.get_public_upstream("git@github.com:openshift-priv/foo.git"), ("https://github.com/openshift-priv/foo", None))
+
+    def test_generate_image_tree(self):
+        rt = stub_runtime()
+        images = {key: flexmock(distgit_key=key, parent=None, children=[]) for key in ("a", "b", "a1", "a2", "b1", "a11", "gone")}
+        images["a"].children = [images["a1"], images["a2"]]
+        images["a1"].children = [images["a11"], images["gone"]]
+        images["b"].children = [images["b1"]]
+        for parent in images.values():
+            for child in parent.children:
+                child.parent = parent
+        del images["gone"]
+        rt.image_map = images
+
+        rt.generate_image_tree()
+        self.assertEqual(rt.image_tree, {"a": {"a1": {"a11": {}}, "a2": {}}, "b": {"b1": {}}})
+        self.assertEqual(rt.image_order, ["a", "b", "a1", "a2", "b1", "a11"])
+        self.assertEqual([m.distgit_key for m in rt.ordered_image_metas()], rt.image_order)
+
+        self.assertEqual(rt.filter_failed_image_trees(["a1"]), ["a1", "a11"])
+        self.assertEqual(rt.image_order, ["a", "b", "a2", "b1"])
+        self.assertEqual([m.distgit_key for m in rt.ordered_image_metas()], rt.image_order)
+        self.assertEqual(len(rt.image_metas()), 4)
+
+    def test_generate_image_tree_multiple_parents(self):
+        rt = stub_runtime()
+        images = {key: flexmock(distgit_key=key, parent=None, children=[]) for key in ("a", "b", "c", "d")}
+        images["a"].children = [images["c"]]
+        images["b"].children = [images["c"]]  # e.g. c is also declared a dependent of b
+        images["c"].children = [images["d"]]
+        images["c"].parent = images["a"]
+        images["d"].parent = images["c"]
+        rt.image_map = images
+
+        rt.generate_image_tree()
+        self.assertEqual(rt.image_tree, {"a": {"c": {"d": {}}}, "b": {"c": {"d": {}}}})
+        self.assertEqual(rt.image_order, ["a", "b", "c", "d"])
+
+    def test_filter_failed_image_trees_dependents(self):
+        rt = stub_runtime()
+        images = {key: flexmock(distgit_key=key, parent=None, children=[]) for key in ("X", "A", "B", "P", "c")}
+        images["X"].children = [images["c"]]  # X declares c as a dependent
+        images["A"].children = [images["B"]]
+        images["B"].children = [images["P"]]
+        images["P"].children = [images["c"]]
+        images["B"].parent = images["A"]
+        images["P"].parent = images["B"]
+        images["c"].parent = images["P"]
+        rt.image_map = images
+
+        rt.generate_image_tree()
+        self.assertEqual(rt.image_order, ["X", "A", "c", "B", "P"])  # c is ordered ahead of its parent P
+        self.assertEqual(rt.filter_failed_image_trees(["B"]), ["B", "P", "c"])
+        self.assertEqual(rt.image_order, ["X", "A"])
+
+    def test_get_product_config_etag(self):
+        rt = stub_runtime()
+        with tempfile.TemporaryDirectory() as cache_dir:
+            rt.cache_dir = cache_dir
+            rt.user = None
+            response = flexmock(read=lambda: b"bug_mapping: {}\n", headers={"ETag": '"abc"'})
+            flexmock(exectools).should_receive("urlopen_assert").once().and_return(response)
+            self.assertEqual(rt.get_product_config().primitive(), {"bug_mapping": {}})
+            self.assertEqual(rt.get_product_config().primitive(), {"bug_mapping": {}})  # memoized on the runtime
+
+            def not_modified(req):
+                self.assertEqual(req.get_header("If-none-match"), '"abc"')
+                raise urllib.error.HTTPError(req.full_url, 304, "Not Modified", {}, None)
+
+            rt._build_data_product_cache = None
+            flexmock(exectools).should_receive("urlopen_assert").replace_with(not_modified).once()
+            self.assertEqual(rt.get_product_config().primitive(), {"bug_mapping": {}})
+            self.assertTrue(os.path.isfile(os.path.join(cache_dir, "default", "product", "product.yml.etag")))
+
+    def test_resolve_source_head(self):
+        rt = stub_runtime()
+        with tempfile.TemporaryDirectory() as source_dir:
+            flexmock(rt).should_receive("resolve_source").and_return(source_dir)
+            os.mkdir(os.path.join(source_dir, ".git"))
+            with open(os.path.join(source_dir, ".git", "HEAD"), "w") as f:
+                f.write("ref: refs/heads/release/4.12\n")
+            self.assertEqual(rt.resolve_source_head(None), "release/4.12")
+
+            with open(os.path.join(source_dir, ".git", "HEAD"), "w") as f:
+                f.write("52edbcd8945af0dc728ad20f53dcd78c7478e8c2\n")
+            self.assertEqual(rt.resolve_source_head(None), "52edbcd8945af0dc728ad20f53dcd78c7478e8c2")
+
+        with tempfile.TemporaryDirectory() as source_dir:  # worktree: .git is a file pointing at the git dir
+            flexmock(rt).should_receive("resolve_source").and_return(source_dir)
+            os.mkdir(os.path.join(source_dir, "real"))
+            with open(os.path.join(source_dir, "real", "HEAD"), "w") as f:
+                f.write("ref: refs/heads/main\n")
+            with open(os.path.join(source_dir, ".git"), "w") as f:
+                f.write("gitdir: real\n")
+            self.assertEqual(rt.resolve_source_head(None), "main")
+
+    def test_checkout_commitish(self):
+        rt = stub_runtime()
+        git = ["git", "-c", "user.name=test", "-c", "user.email=test@example.com"]
+        with tempfile.TemporaryDirectory() as source_dir:
+            exectools.cmd_assert(git + ["init", "-q", source_dir])
+            exectools.cmd_assert(git + ["-C", source_dir, "commit", "-q", "--allow-empty", "-m", "first"])
+            exectools.cmd_assert(git + ["-C", source_dir, "branch", "release-4.12"])
+            exectools.cmd_assert(git + ["-C", source_dir, "commit", "-q", "--allow-empty", "-m", "second"])
+            first, _ = exectools.cmd_assert(git + ["-C", source_dir, "rev-parse", "HEAD~1"], strip=True)
+            flexmock(rt).should_receive("resolve_source").and_return(source_dir)
+
+            rt._checkout_commitish(source_dir, "release-4.12")
+            self.assertEqual(rt.resolve_source_head(None), "release-4.12")
+
+            rt._checkout_commitish(source_dir, first)
+            self.assertEqual(rt.resolve_source_head(None), first)
+
+            with self.assertRaises(ChildProcessError):
+                rt._checkout_commitish(source_dir, "no-such-branch")
+
+    def test_export_sources(self):
+        rt = stub_runtime()
+        rt.source_resolutions = {
+            "ose": runtime.SourceResolution("/tmp/sources/ose", "https://example.com/ose", "main", None, None),
+            "cli: tools": runtime.SourceResolution("/tmp/sources/a #b", "https://example.com/cli", "main", None, None),
+            "yes": runtime.SourceResolution("/tmp/sources/yes", "https://example.com/yes", "main", None, None),
+        }
+        with tempfile.TemporaryDirectory() as tmpdir:
+            output = os.path.join(tmpdir, "sources.yml")
+            rt.export_sources(output)
+            with open(output) as f:
+                content = f.read()
+        self.assertEqual(content.splitlines()[0], '"cli: tools": "/tmp/sources/a #b"')
+        self.assertEqual(yaml.safe_load(content), {k: v.source_path for k, v in rt.source_resolutions.items()})
+
+    def test_get_el_targeted_default_branch(self):
+        rt = stub_runtime()
+        rt.branch = "rhaos-4.14-rhel-9"
+        self.assertEqual(rt.get_el_targeted_default_branch(), "rhaos-4.14-rhel-9")
+        self.assertEqual(rt.get_el_targeted_default_branch(8), "rhaos-4.14-rhel-8")
+        self.assertEqual(rt.get_default_candidate_brew_tag(8), "rhaos-4.14-rhel-8-candidate")
+        rt.branch = "rhaos-4.14"
+        self.assertEqual(rt.get_el_targeted_default_branch(8), "rhaos-4.14")
+
+    def test_discard_source_dir(self):
+        rt = stub_runtime()
+        rt.logger = logutil.getLogger(__name__)
+        with tempfile.TemporaryDirectory() as sources_dir:
+            source_dir = os.path.join(sources_dir, "ose")
+            os.makedirs(os.path.join(source_dir, ".git"))
+            removed = []
+            flexmock(runtime).should_receive("remove_dir_in_background").replace_with(removed.append).once()
+            rt._discard_source_dir(source_dir)
+            self.assertFalse(os.path.exists(source_dir))
+            self.assertEqual(len(removed), 1)
+            self.assertTrue(runtime.FAILED_SOURCE_DIR_PATTERN.search(removed[0]))
+            self.assertTrue(os.path.isdir(removed[0]))
+
+            rt._discard_source_dir(source_dir)  # nothing left to discard
+
 
 if __name__ == "__main__":
     unittest.main()
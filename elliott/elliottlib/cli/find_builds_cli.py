@@ -2,11 +2,12 @@ import asyncio
 import functools
 import json
 import re
-from typing import Dict, List, Set, Union
+from collections import defaultdict
+from typing import Dict, List, Set, Tuple
 
 import click
 import koji
-import requests
+from aiohttp import ClientResponseError
 from errata_tool import ErrataException
 
 import elliottlib
@@ -17,17 +18,21 @@ from elliottlib.rhcos import get_container_configs
 from elliottlib.build_finder import BuildFinder
 from elliottlib.cli.common import (cli, find_default_advisory,
                                    use_default_advisory_option, click_coroutine)
-from elliottlib.exceptions import ElliottFatalError
+from elliottlib.errata_async import AsyncErrataAPI
+from elliottlib.exceptions import BrewBuildException, ElliottFatalError
 from elliottlib.imagecfg import ImageMetadata
 from elliottlib.cli.rhcos_cli import get_build_id_from_rhcos_pullspec
 from elliottlib.util import (ensure_erratatool_auth, brew_arches,
                              get_release_version, green_prefix, green_print,
                              isolate_el_version_in_brew_tag,
-                             parallel_results_with_progress, pbar_header, progress_func,
+                             pbar_header, progress_func,
                              red_print, yellow_print)
 
 LOGGER = logutil.getLogger(__name__)
 
+# A shipped build with OCP Errata has a Brew tag like `RHBA-2020:2713-released`; https://issues.redhat.com/browse/ART-3277
+RELEASED_TAG_PATTERN = re.compile(r"^RH[BSE]A-.+-released$")
+
 pass_runtime = click.make_pass_decorator(Runtime)
 
 #
@@ -133,7 +138,12 @@ PRESENT advisory. Here are some examples:
     if payload and non_payload:
         raise click.BadParameter('Use only one of --payload or --non-payload.')
 
-    runtime.initialize(mode='images' if kind == 'image' else 'rpms')
+    # Loading the group and checking Errata Tool authentication are independent network round trips; overlap them.
+    # Check authentication before we waste time looking up builds we can't process.
+    await asyncio.gather(
+        exectools.to_thread(runtime.initialize, mode='images' if kind == 'image' else 'rpms'),
+        exectools.to_thread(ensure_erratatool_auth),
+    )
     replace_vars = runtime.group_config.vars.primitive() if runtime.group_config.vars else {}
     et_data = runtime.get_errata_config(replace_vars=replace_vars)
     tag_pv_map = et_data.get('brew_tag_product_version_mapping')
@@ -141,8 +151,6 @@ PRESENT advisory. Here are some examples:
     if default_advisory_type is not None:
         advisory_id = find_default_advisory(runtime, default_advisory_type)
 
-    ensure_erratatool_auth()  # before we waste time looking up builds we can't process
-
     unshipped_nvrps = []
     unshipped_builds = []
     to_remove = []
@@ -157,35 +165,41 @@ PRESENT advisory. Here are some examples:
         unshipped_builds = errata.get_brew_builds(advisory_id)
     else:
         if kind == 'image':
-            unshipped_nvrps = await _fetch_builds_by_kind_image(runtime, tag_pv_map, brew_session, payload,
-                                                                non_payload, include_shipped)
+            image_nvrps = _fetch_builds_by_kind_image(runtime, tag_pv_map, brew_session, payload,
+                                                      non_payload, include_shipped)
             if payload:
-                rhcos_nvrs = get_rhcos_nvrs_from_assembly(runtime, brew_session)
-                unshipped_rhcos_nvrps = _fetch_nvrps_by_nvr_or_id(rhcos_nvrs, tag_pv_map, include_shipped=include_shipped,
-                                                                  brew_session=brew_session)
+                # RHCOS builds are independent of the image builds; look them up at the same time
+                unshipped_nvrps, unshipped_rhcos_nvrps = await asyncio.gather(
+                    image_nvrps, _fetch_rhcos_nvrps(runtime, tag_pv_map, include_shipped))
                 unshipped_nvrps.extend(unshipped_rhcos_nvrps)
+            else:
+                unshipped_nvrps = await image_nvrps
         elif kind == 'rpm':
             unshipped_nvrps = await _fetch_builds_by_kind_rpm(runtime, tag_pv_map, brew_session, include_shipped, member_only)
 
-    pbar_header(
-        'Fetching builds from Errata: ',
-        'Hold on a moment, fetching buildinfos from Errata Tool...',
-        unshipped_builds if clean else unshipped_nvrps)
-
-    if not (clean or remove):
+    if remove:
+        # builds to remove are identified by NVR alone; there is nothing to fetch from Errata
+        to_remove = [f"{nvrp[0]}-{nvrp[1]}-{nvrp[2]}" for nvrp in unshipped_nvrps]
+    elif clean:
+        to_remove = [b.nvr for b in unshipped_builds]
+    else:
         # if is --clean then batch fetch from Erratum no need to fetch them individually
         # if is not for --clean fetch individually using nvrp tuples then get specific
         # elliottlib.brew.Build Objects by get_brew_build()
         # e.g. :
         # ('atomic-openshift-descheduler-container', 'v4.3.23', '202005250821', 'RHEL-7-OSE-4.3').
         # Build(atomic-openshift-descheduler-container-v4.3.23-202005250821).
-        unshipped_builds = parallel_results_with_progress(
-            unshipped_nvrps,
-            lambda nvrp: errata.get_brew_build(f'{nvrp[0]}-{nvrp[1]}-{nvrp[2]}',
-                                               nvrp[3], session=requests.Session())
-        )
+        pbar_header(
+            'Fetching builds from Errata: ',
+            'Hold on a moment, fetching buildinfos from Errata Tool...',
+            unshipped_nvrps)
+        errata_api = AsyncErrataAPI(et_data.get("server", constants.errata_url))
+        try:
+            unshipped_builds = await _fetch_errata_builds(errata_api, unshipped_nvrps)
+        finally:
+            await errata_api.close()
         previous = len(unshipped_builds)
-        unshipped_builds, attached_to_advisories = _filter_out_attached_builds(unshipped_builds)
+        unshipped_builds, attached_to_advisories = await _filter_out_attached_builds(unshipped_builds)
         if len(unshipped_builds) != previous:
             click.echo(f'Filtered out {previous - len(unshipped_builds)} build(s) since they are already attached to '
                        f'these advisories: {attached_to_advisories}')
@@ -197,29 +211,25 @@ PRESENT advisory. Here are some examples:
             return
 
     if not advisory_id:
-        click.echo('The following {n} builds '.format(n=len(unshipped_builds)), nl=False)
+        nvrs = to_remove if (remove or clean) else [b.nvr for b in unshipped_builds]
+        click.echo('The following {n} builds '.format(n=len(nvrs)), nl=False)
         if not (remove or clean):
             click.secho('may be attached', bold=True, nl=False)
             click.echo(' to an advisory:')
         else:
             click.secho('may be removed from', bold=True, nl=False)
             click.echo(' from an advisory:')
-        for b in sorted(unshipped_builds):
-            click.echo(' ' + b.nvr)
+        for nvr in sorted(nvrs):
+            click.echo(' ' + nvr)
         return
 
-    if not unshipped_builds and not (remove and unshipped_nvrps):
+    if not (unshipped_builds or to_remove):
         # Do not change advisory state unless strictly necessary
         return
 
     try:
         erratum = errata.Advisory(errata_id=advisory_id)
         erratum.ensure_state('NEW_FILES')
-        if remove:
-            to_remove = [f"{nvrp[0]}-{nvrp[1]}-{nvrp[2]}" for nvrp in unshipped_nvrps]
-        elif clean:
-            to_remove = [b.nvr for b in unshipped_builds]
-
         if to_remove:
             erratum.remove_builds(to_remove)
         else:  # attach
@@ -235,35 +245,44 @@ PRESENT advisory. Here are some examples:
         exit(1)
 
 
-def get_rhcos_nvrs_from_assembly(runtime: Runtime, brew_session: koji.ClientSession = None):
+async def get_rhcos_nvrs_from_assembly(runtime: Runtime, brew_session: koji.ClientSession = None):
     rhcos_config = assembly_rhcos_config(runtime.get_releases_config(), runtime.assembly)
-    build_ids_by_arch = dict()
+    build_ids_by_arch = defaultdict(set)
     nvrs = []
 
     # Keys under rhcos_config are not necessary payload tags. One exception is `dependencies`
     # make sure we only process payload tags
     rhcos_payload_tags = [c['name'] for c in get_container_configs(runtime)]
-    for key, config in rhcos_config.items():
-        if key not in rhcos_payload_tags:
-            continue
-
-        for arch, pullspec in config['images'].items():
-            build_id = get_build_id_from_rhcos_pullspec(pullspec, runtime.logger)
-            if arch not in build_ids_by_arch:
-                build_ids_by_arch[arch] = set()
-            build_ids_by_arch[arch].add(build_id)
-
-    for arch, builds in build_ids_by_arch.items():
-        for build_id in builds:
-            nvr = f'rhcos-{arch}-{build_id}'
-            if brew_session.getBuild(nvr):
-                runtime.logger.info(f'Found rhcos nvr: {nvr}')
-                nvrs.append(nvr)
-            else:
-                runtime.logger.warning(f'rhcos nvr not found: {nvr}')
+    arch_pullspecs = [(arch, pullspec)
+                      for key, config in rhcos_config.items() if key in rhcos_payload_tags
+                      for arch, pullspec in config['images'].items()]
+
+    # Each lookup inspects a remote image, so run them concurrently
+    build_ids = await asyncio.gather(*[exectools.to_thread(get_build_id_from_rhcos_pullspec, pullspec, runtime.logger)
+                                       for _, pullspec in arch_pullspecs])
+    for (arch, _), build_id in zip(arch_pullspecs, build_ids):
+        build_ids_by_arch[arch].add(build_id)
+
+    candidate_nvrs = [f'rhcos-{arch}-{build_id}' for arch, builds in build_ids_by_arch.items() for build_id in builds]
+    with brew_session.multicall(strict=False) as m:
+        tasks = [m.getBuild(nvr) for nvr in candidate_nvrs]
+    for nvr, task in zip(candidate_nvrs, tasks):
+        if task.result:
+            runtime.logger.info(f'Found rhcos nvr: {nvr}')
+            nvrs.append(nvr)
+        else:
+            runtime.logger.warning(f'rhcos nvr not found: {nvr}')
     return nvrs
 
 
+async def _fetch_rhcos_nvrps(runtime: Runtime, tag_pv_map: Dict[str, str], include_shipped: bool):
+    # Use a koji session of our own, since this runs alongside lookups using the command's session
+    brew_session = runtime.build_retrying_koji_client(caching=True)
+    rhcos_nvrs = await get_rhcos_nvrs_from_assembly(runtime, brew_session)
+    return await exectools.to_thread(_fetch_nvrps_by_nvr_or_id, rhcos_nvrs, tag_pv_map,
+                                     include_shipped=include_shipped, brew_session=brew_session)
+
+
 def ensure_rhcos_file_meta(advisory_id):
     # this assumes that the advisory is in NEW_FILES state
 
@@ -293,18 +312,12 @@ def ensure_rhcos_file_meta(advisory_id):
 def _fetch_nvrps_by_nvr_or_id(ids_or_nvrs, tag_pv_map, include_shipped=False, ignore_product_version=False,
                               brew_session: koji.ClientSession = None):
     builds = brew.get_build_objects(ids_or_nvrs, brew_session)
-    nonexistent_builds = list(filter(lambda b: b[1] is None, zip(ids_or_nvrs, builds)))
+    nonexistent_builds = [id_or_nvr for id_or_nvr, build in zip(ids_or_nvrs, builds) if build is None]
     if nonexistent_builds:
-        raise ValueError(f"The following builds are not found in Brew: {' '.join(map(lambda b: b[0],nonexistent_builds))}")
+        raise ValueError(f"The following builds are not found in Brew: {' '.join(map(str, nonexistent_builds))}")
 
     _ensure_accepted_tags(builds, brew_session, tag_pv_map)
-    shipped = set()
-    if include_shipped:
-        click.echo("Do not filter out shipped builds, all builds will be attached")
-    else:
-        click.echo("Filtering out shipped builds...")
-        shipped = _find_shipped_builds([b["id"] for b in builds], brew_session)
-    unshipped = [b for b in builds if b["id"] not in shipped]
+    shipped, unshipped = _partition_by_shipped(builds, brew_session, include_shipped)
     click.echo(f'Found {len(shipped) + len(unshipped)} builds, of which {len(unshipped)} are new.')
 
     nvrps = []
@@ -321,6 +334,26 @@ def _fetch_nvrps_by_nvr_or_id(ids_or_nvrs, tag_pv_map, include_shipped=False, ig
     return nvrps
 
 
+async def _fetch_errata_builds(errata_api: AsyncErrataAPI, nvrps) -> List[brew.Build]:
+    """ Fetches Errata Tool build details of (name, version, release, product_version) tuples concurrently
+    :param errata_api: Errata Tool API client
+    :param nvrps: list of (name, version, release, product_version) tuples
+    :return: a list of elliottlib.brew.Build objects, in the same order as nvrps
+    """
+    async def _fetch(nvrp):
+        nvr = f'{nvrp[0]}-{nvrp[1]}-{nvrp[2]}'
+        try:
+            body = await errata_api.get_build(nvr)
+        except ClientResponseError as e:
+            raise BrewBuildException(f"{nvr}: {e.message}")
+        return progress_func(lambda: brew.Build(nvr=nvr, body=body, product_version=nvrp[3]))
+
+    click.secho('[', nl=False)
+    builds = await asyncio.gather(*[_fetch(nvrp) for nvrp in nvrps])
+    click.echo(']')
+    return builds
+
+
 def _gen_nvrp_tuples(builds: List[Dict], tag_pv_map: Dict[str, str]):
     """Returns a list of (name, version, release, product_version) tuples of each build """
     nvrps = [(b['name'], b['version'], b['release'], tag_pv_map[b['tag_name']]) for b in builds]
@@ -329,13 +362,10 @@ def _gen_nvrp_tuples(builds: List[Dict], tag_pv_map: Dict[str, str]):
 
 def _json_dump(as_json, unshipped_builds, kind, tag_pv_map):
     if as_json:
-        builds = []
-        tags = []
         reversed_tag_pv_map = {y: x for x, y in tag_pv_map.items()}
-        for b in sorted(unshipped_builds):
-            builds.append(b.nvr)
-            tags.append(reversed_tag_pv_map[b.product_version])
-        json_data = dict(builds=builds, base_tag=tags, kind=kind)
+        # Sort on the NVR strings rather than the Build objects; a build attached to more than one product version is listed once per tag
+        nvr_tags = sorted((b.nvr, reversed_tag_pv_map[b.product_version]) for b in unshipped_builds)
+        json_data = dict(builds=[nvr for nvr, _ in nvr_tags], base_tag=[tag for _, tag in nvr_tags], kind=kind)
         if as_json == '-':
             click.echo(json.dumps(json_data, indent=4, sort_keys=True))
         else:
@@ -343,21 +373,37 @@ def _json_dump(as_json, unshipped_builds, kind, tag_pv_map):
                 json.dump(json_data, json_file, indent=4, sort_keys=True)
 
 
-def _find_shipped_builds(build_ids: List[Union[str, int]], brew_session: koji.ClientSession) -> Set[Union[str, int]]:
-    """ Finds shipped builds
-    :param builds: list of Brew build IDs or NVRs
+def _cache_builds_tags(builds: List[Dict], brew_session: koji.ClientSession):
+    """ Queries the Brew tag names of builds that don't have them cached yet and stores them under the "_tags" key,
+    so that accepted tag resolution and shipped build detection share a single listTags multicall.
+    """
+    uncached_builds = [b for b in builds if "_tags" not in b]
+    build_tag_lists = brew.get_builds_tags([b["id"] for b in uncached_builds], brew_session)
+    for build, tags in zip(uncached_builds, build_tag_lists):
+        build["_tags"] = {tag['name'] for tag in tags}
+
+
+def _partition_by_shipped(builds: List[Dict], brew_session: koji.ClientSession,
+                          include_shipped: bool = False) -> Tuple[List[Dict], List[Dict]]:
+    """ Splits builds into shipped and unshipped ones
+    :param builds: list of Brew build dicts
     :param brew_session: Brew session
-    :return: a set of shipped Brew build IDs or NVRs
+    :param include_shipped: If True, don't look for shipped builds; all builds are treated as unshipped
+    :return: a (shipped, unshipped) tuple of Brew build dict lists
     """
-    shipped_ids = set()
-    tag_lists = brew.get_builds_tags(build_ids, brew_session)
-    released_tag_pattern = re.compile(r"^RH[BSE]A-.+-released$")  # https://issues.redhat.com/browse/ART-3277
-    for build_id, tags in zip(build_ids, tag_lists):
+    if include_shipped:
+        click.echo("Do not filter out shipped builds, all builds will be attached")
+        return [], list(builds)
+    click.echo("Filtering out shipped builds...")
+    _cache_builds_tags(builds, brew_session)
+    shipped, unshipped = [], []
+    for build in builds:
         # a shipped build with OCP Errata should have a Brew tag ending with `-released`, like `RHBA-2020:2713-released`
-        shipped = any(map(lambda tag: released_tag_pattern.match(tag["name"]), tags))
-        if shipped:
-            shipped_ids.add(build_id)
-    return shipped_ids
+        if any(RELEASED_TAG_PATTERN.match(tag) for tag in build["_tags"]):
+            shipped.append(build)
+        else:
+            unshipped.append(build)
+    return shipped, unshipped
 
 
 async def _fetch_builds_by_kind_image(runtime: Runtime, tag_pv_map: Dict[str, str],
@@ -377,14 +423,8 @@ async def _fetch_builds_by_kind_image(runtime: Runtime, tag_pv_map: Dict[str, st
     brew_latest_builds: List[Dict] = await asyncio.gather(*[exectools.to_thread(progress_func, image.get_latest_build) for image in image_metas])
 
     _ensure_accepted_tags(brew_latest_builds, brew_session, tag_pv_map)
-    shipped = set()
-    if include_shipped:
-        click.echo("Do not filter out shipped builds, all builds will be attached")
-    else:
-        click.echo("Filtering out shipped builds...")
-        shipped = _find_shipped_builds([b["id"] for b in brew_latest_builds], brew_session)
-    unshipped = [b for b in brew_latest_builds if b["id"] not in shipped]
-    click.echo(f'Found {len(shipped)+len(unshipped)} builds, of which {len(unshipped)} are new.')
+    shipped, unshipped = _partition_by_shipped(brew_latest_builds, brew_session, include_shipped)
+    click.echo(f'Found {len(shipped) + len(unshipped)} builds, of which {len(unshipped)} are new.')
     nvrps = _gen_nvrp_tuples(unshipped, tag_pv_map)
     return nvrps
 
@@ -396,13 +436,11 @@ def _ensure_accepted_tags(builds: List[Dict], brew_session: koji.ClientSession,
     For those build dicts whose tags are unknown, we need to query from Brew.
     """
     builds = [b for b in builds if "tag_name" not in b]  # filters out builds whose accepted tag is already set
-    unknown_tags_builds = [b for b in builds if "_tags" not in b]  # finds builds whose tags are not cached
-    build_tag_lists = brew.get_builds_tags(unknown_tags_builds, brew_session)
-    for build, tags in zip(unknown_tags_builds, build_tag_lists):
-        build["_tags"] = {tag['name'] for tag in tags}
+    _cache_builds_tags(builds, brew_session)
     # Finds and sets the accepted tag (rhaos-x.y-rhel-z-[candidate|hotfix]) for each build
+    accepted_tags = tag_pv_map.keys()
     for build in builds:
-        accepted_tag = next(filter(lambda tag: tag in tag_pv_map, build["_tags"]), None)
+        accepted_tag = next(iter(build["_tags"] & accepted_tags), None)
         if not accepted_tag:
             msg = f"Build {build['nvr']} has Brew tags {build['_tags']}, but none of them has an associated Errata product version."
             if raise_exception:
@@ -415,6 +453,7 @@ def _ensure_accepted_tags(builds: List[Dict], brew_session: koji.ClientSession,
 
 async def _fetch_builds_by_kind_rpm(runtime: Runtime, tag_pv_map: Dict[str, str], brew_session: koji.ClientSession, include_shipped: bool, member_only: bool):
     assembly = runtime.assembly
+    releases_config = runtime.get_releases_config()
     if runtime.assembly_basis_event:
         LOGGER.info(f'Constraining rpm search to stream assembly due to assembly basis event {runtime.assembly_basis_event}')
         # If an assembly has a basis event, its latest rpms can only be sourced from
@@ -422,53 +461,27 @@ async def _fetch_builds_by_kind_rpm(runtime: Runtime, tag_pv_map: Dict[str, str]
         assembly = 'stream'
 
         # ensures the runtime assembly doesn't include any image member specific or rhcos specific dependencies
-        image_configs = [assembly_metadata_config(runtime.get_releases_config(), runtime.assembly, 'image', image.distgit_key, image.config) for _, image in runtime.image_map.items()]
+        image_configs = [assembly_metadata_config(releases_config, runtime.assembly, 'image', image.distgit_key, image.config) for _, image in runtime.image_map.items()]
         if any(nvr for image_config in image_configs for dep in image_config.dependencies.rpms for _, nvr in dep.items()):
             raise ElliottFatalError(f"Assembly {runtime.assembly} is not appliable for build sweep because it contains image member specific dependencies for a custom release.")
-        rhcos_config = assembly_rhcos_config(runtime.get_releases_config(), runtime.assembly)
+        rhcos_config = assembly_rhcos_config(releases_config, runtime.assembly)
         if any(nvr for dep in rhcos_config.dependencies.rpms for _, nvr in dep.items()):
             raise ElliottFatalError(f"Assembly {runtime.assembly} is not appliable for build sweep because it contains RHCOS specific dependencies for a custom release.")
 
     green_prefix('Generating list of rpms: ')
     click.echo('Hold on a moment, fetching Brew builds')
-    builds: List[Dict] = []
+    builds: List[Dict]
 
     if member_only:  # Sweep only member rpms
-        for tag in tag_pv_map:
-            tasks = [exectools.to_thread(progress_func, functools.partial(rpm.get_latest_build, default=None, el_target=tag)) for rpm in runtime.rpm_metas()]
-            builds_for_tag = await asyncio.gather(*tasks)
-            builds.extend(filter(lambda b: b is not None, builds_for_tag))
+        tasks = [exectools.to_thread(progress_func, functools.partial(rpm.get_latest_build, default=None, el_target=tag))
+                 for tag in tag_pv_map for rpm in runtime.rpm_metas()]
+        builds = [b for b in await asyncio.gather(*tasks) if b is not None]
 
     else:  # Sweep all tagged rpms
-        builder = BuildFinder(brew_session, logger=LOGGER)
-        for tag in tag_pv_map:
-            # keys are rpm component names, values are nvres
-            component_builds: Dict[str, Dict] = builder.from_tag("rpm", tag, inherit=False, assembly=assembly, event=runtime.brew_event)
-            if runtime.assembly_basis_event:
-                # If an assembly has a basis event, rpms pinned by "is" and group dependencies should take precedence over every build from the tag
-                el_version = isolate_el_version_in_brew_tag(tag)
-                if not el_version:
-                    continue  # Only honor pinned rpms if this tag is relevant to a RHEL version
-
-                # Honors pinned NVRs by "is"
-                pinned_by_is = builder.from_pinned_by_is(el_version, runtime.assembly, runtime.get_releases_config(), runtime.rpm_map)
-                _ensure_accepted_tags(pinned_by_is.values(), brew_session, tag_pv_map)
-
-                # Builds pinned by "is" should take precedence over every build from tag
-                for component, pinned_build in pinned_by_is.items():
-                    if component in component_builds and pinned_build["id"] != component_builds[component]["id"]:
-                        LOGGER.warning("Swapping stream nvr %s for pinned nvr %s...", component_builds[component]["nvr"], pinned_build["nvr"])
-
-                component_builds.update(pinned_by_is)  # pinned rpms take precedence over those from tags
-
-                # Honors group dependencies
-                group_deps = builder.from_group_deps(el_version, runtime.group_config, runtime.rpm_map)  # the return value doesn't include any ART managed rpms
-                # Group dependencies should take precedence over anything previously determined except those pinned by "is".
-                for component, dep_build in group_deps.items():
-                    if component in component_builds and dep_build["id"] != component_builds[component]["id"]:
-                        LOGGER.warning("Swapping stream nvr %s for group dependency nvr %s...", component_builds[component]["nvr"], dep_build["nvr"])
-                component_builds.update(group_deps)
-            builds.extend(component_builds.values())
+        # Tags are independent of each other, so sweep them concurrently
+        tag_builds = await asyncio.gather(*[exectools.to_thread(_find_rpm_builds_in_tag, runtime, tag, assembly, releases_config, tag_pv_map)
+                                            for tag in tag_pv_map])
+        builds = [b for component_builds in tag_builds for b in component_builds]
 
     _ensure_accepted_tags(builds, brew_session, tag_pv_map, raise_exception=False)
     qualified_builds = [b for b in builds if "tag_name" in b]
@@ -479,45 +492,83 @@ async def _fetch_builds_by_kind_rpm(runtime: Runtime, tag_pv_map: Dict[str, str]
         for nvr in not_attachable_nvrs:
             yellow_print(f"\t{nvr}")
 
-    shipped = set()
-    if include_shipped:
-        click.echo("Do not filter out shipped builds, all builds will be attached")
-    else:
-        click.echo("Filtering out shipped builds...")
-        shipped = _find_shipped_builds([b["id"] for b in qualified_builds], brew_session)
-    unshipped = [b for b in qualified_builds if b["id"] not in shipped]
-    click.echo(f'Found {len(shipped)+len(unshipped)} builds, of which {len(unshipped)} are new.')
-    nvrps = _gen_nvrp_tuples(unshipped, tag_pv_map)
-    nvrps = sorted(set(nvrps))  # remove duplicates
-    return nvrps
+    shipped, unshipped = _partition_by_shipped(qualified_builds, brew_session, include_shipped)
+    click.echo(f'Found {len(shipped) + len(unshipped)} builds, of which {len(unshipped)} are new.')
+    # The same build may be tagged into more than one swept tag; collect into a set to remove duplicates
+    nvrps = {(b['name'], b['version'], b['release'], tag_pv_map[b['tag_name']]) for b in unshipped}
+    return sorted(nvrps)
 
 
-def _filter_out_attached_builds(build_objects):
+def _find_rpm_builds_in_tag(runtime: Runtime, tag: str, assembly: str, releases_config, tag_pv_map: Dict[str, str]) -> List[Dict]:
+    """ Finds the rpm builds to sweep from a Brew tag, honoring rpms pinned by "is" and group dependencies
+    if the assembly has a basis event. Runs in a worker thread, so it uses its own pooled koji session.
+    :return: a list of Brew build dicts
+    """
+    with runtime.pooled_koji_client_session(caching=True) as koji_api:
+        builder = BuildFinder(koji_api, logger=LOGGER)
+        # keys are rpm component names, values are nvres
+        component_builds: Dict[str, Dict] = builder.from_tag("rpm", tag, inherit=False, assembly=assembly, event=runtime.brew_event)
+        if runtime.assembly_basis_event:
+            # If an assembly has a basis event, rpms pinned by "is" and group dependencies should take precedence over every build from the tag
+            el_version = isolate_el_version_in_brew_tag(tag)
+            if not el_version:
+                return []  # Only honor pinned rpms if this tag is relevant to a RHEL version
+
+            # Honors pinned NVRs by "is"
+            pinned_by_is = builder.from_pinned_by_is(el_version, runtime.assembly, releases_config, runtime.rpm_map)
+            _ensure_accepted_tags(pinned_by_is.values(), koji_api, tag_pv_map)
+
+            # Builds pinned by "is" should take precedence over every build from tag
+            for component, pinned_build in pinned_by_is.items():
+                if component in component_builds and pinned_build["id"] != component_builds[component]["id"]:
+                    LOGGER.warning("Swapping stream nvr %s for pinned nvr %s...", component_builds[component]["nvr"], pinned_build["nvr"])
+
+            component_builds.update(pinned_by_is)  # pinned rpms take precedence over those from tags
+
+            # Honors group dependencies
+            group_deps = builder.from_group_deps(el_version, runtime.group_config, runtime.rpm_map)  # the return value doesn't include any ART managed rpms
+            # Group dependencies should take precedence over anything previously determined except those pinned by "is".
+            for component, dep_build in group_deps.items():
+                if component in component_builds and dep_build["id"] != component_builds[component]["id"]:
+                    LOGGER.warning("Swapping stream nvr %s for group dependency nvr %s...", component_builds[component]["nvr"], dep_build["nvr"])
+            component_builds.update(group_deps)
+        return list(component_builds.values())
+
+
+@functools.lru_cache(maxsize=2048)  # advisory metadata is not expected to change during a run
+def _errata_release_version(eid) -> str:
+    """ Returns the OCP release an advisory was created for according to its ART metadata comment,
+    or '' if the advisory has no ART metadata.
+    """
+    metadata_comments_json = errata.get_metadata_comments_json(eid)
+    if not metadata_comments_json:
+        # Does not contain ART metadata; consider it unversioned
+        red_print("Errata {} Does not contain ART metadata\n".format(eid))
+        return ''
+    # it's possible for an advisory to have multiple metadata comments,
+    # though not very useful (there's a command for adding them,
+    # but not much point in doing it). just looking at the first one is fine.
+    return metadata_comments_json[0]['release']
+
+
+async def _filter_out_attached_builds(build_objects):
     """
     Filter out builds that are already attached to an ART advisory
     """
+    # Look up the release of every advisory the builds are attached to concurrently, once per advisory
+    eids = list({e['id'] for b in build_objects for e in b.all_errata})
+    versions = await asyncio.gather(*[exectools.to_thread(_errata_release_version, eid) for eid in eids])
+    eids_by_version: Dict[str, Set[int]] = defaultdict(set)
+    for eid, version in zip(eids, versions):
+        eids_by_version[version].add(eid)
+
     unattached_builds = []
-    errata_version_cache = {}  # avoid reloading the same errata for multiple builds
     attached_to_advisories = set()
     for b in build_objects:
         # check if build is attached to any existing advisory for this version
-        in_same_version = False
-        for eid in [e['id'] for e in b.all_errata]:
-            if eid not in errata_version_cache:
-                metadata_comments_json = errata.get_metadata_comments_json(eid)
-                if not metadata_comments_json:
-                    # Does not contain ART metadata; consider it unversioned
-                    red_print("Errata {} Does not contain ART metadata\n".format(eid))
-                    errata_version_cache[eid] = ''
-                    continue
-                # it's possible for an advisory to have multiple metadata comments,
-                # though not very useful (there's a command for adding them,
-                # but not much point in doing it). just looking at the first one is fine.
-                errata_version_cache[eid] = metadata_comments_json[0]['release']
-            if errata_version_cache[eid] == get_release_version(b.product_version):
-                in_same_version = True
-                attached_to_advisories.add(eid)
-                break
-        if not in_same_version:
+        same_version_eids = {e['id'] for e in b.all_errata} & eids_by_version.get(get_release_version(b.product_version), set())
+        if same_version_eids:
+            attached_to_advisories |= same_version_eids
+        else:
             unattached_builds.append(b)
     return unattached_builds, attached_to_advisories
@@ -61,6 +61,11 @@ class AsyncErrataAPI:
             nvr for pv in pv_builds.values() for pvb in pv["builds"] for nvr in pvb
         }
 
+    @limit_concurrency(limit=32)
+    async def get_build(self, nvr_or_id: Union[int, str]) -> Dict:
+        path = f"/api/v1/build/{quote(str(nvr_or_id))}"
+        return await self._make_request(aiohttp.hdrs.METH_GET, path)
+
     async def get_cves(self, advisory: Union[int, str]) -> List[str]:
         # Errata API "/cve/show/{advisory}.json" doesn't return the correct CVEs for some RHSAs.
         # Not sure if it's an Errata bug. Use a different approach instead.
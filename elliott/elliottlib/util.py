@@ -1,5 +1,6 @@
 import datetime, re, click
 from collections import deque
+from functools import lru_cache
 from itertools import chain
 from multiprocessing import cpu_count
 from multiprocessing.dummy import Pool as ThreadPool
@@ -239,6 +240,7 @@ def parallel_results_with_progress(inputs, func, file=None):
     return results
 
 
+@lru_cache(maxsize=None)  # only a handful of product versions are seen per run
 def get_release_version(pv):
     """ known formats of product_version:
         - OSE-4.1-RHEL-8
@@ -55,6 +55,15 @@ class TestAsyncErrataAPI(IsolatedAsyncioTestCase):
         _make_request.assert_awaited_once_with(ANY, "GET", "/api/v1/erratum/RHBA-2021%3A0001")
         self.assertEqual(actual, {"result": "fake"})
 
+    @patch("aiohttp.ClientSession", autospec=True)
+    @patch("elliottlib.errata_async.AsyncErrataAPI._make_request", autospec=True)
+    async def test_get_build(self, _make_request: Mock, ClientSession: Mock):
+        api = AsyncErrataAPI("https://errata.example.com")
+        _make_request.return_value = {"id": 1, "nvr": "a-1.0.0-1.el8"}
+        actual = await api.get_build("a-1.0.0-1.el8")
+        _make_request.assert_awaited_once_with(ANY, "GET", "/api/v1/build/a-1.0.0-1.el8")
+        self.assertEqual(actual, {"id": 1, "nvr": "a-1.0.0-1.el8"})
+
     @patch("aiohttp.ClientSession", autospec=True)
     @patch("elliottlib.errata_async.AsyncErrataAPI._make_request", autospec=True)
     async def test_get_builds(self, _make_request: Mock, ClientSession: Mock):
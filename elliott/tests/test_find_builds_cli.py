@@ -1,9 +1,13 @@
 import unittest
-from elliottlib.cli.find_builds_cli import _filter_out_attached_builds, _find_shipped_builds
+from elliottlib.cli import find_builds_cli
+from elliottlib.cli.find_builds_cli import (_ensure_accepted_tags, _fetch_errata_builds, _filter_out_attached_builds,
+                                            _partition_by_shipped)
 from elliottlib.brew import Build
 from elliottlib import errata as erratalib
 from flexmock import flexmock
 import json
+import os
+import tempfile
 from unittest import mock
 
 
@@ -12,43 +16,147 @@ class TestFindBuildsCli(unittest.TestCase):
     Test elliott find-builds command and internal functions
     """
 
-    def test_filter_out_attached_builds_inviable(self):
+    @mock.patch("elliottlib.brew.get_builds_tags")
+    def test_partition_by_shipped(self, get_builds_tags: mock.MagicMock):
+        build_ids = [11, 12, 13, 14, 15]
+        build_tags = [
+            [{"name": "foo-candidate"}],
+            [{"name": "bar-candidate"}, {"name": "bar-released"}],
+            [{"name": "bar-candidate"}, {"name": "RHBA-2077:1001-released"}],
+            [{"name": "bar-candidate"}, {"name": "RHSA-2077:1002-released"}],
+            [],
+        ]
+        get_builds_tags.return_value = build_tags
+        builds = [{"id": build_id} for build_id in build_ids]
+        builds.append({"id": 16, "_tags": {"RHBA-2077:1003-released"}})  # tags already cached by _ensure_accepted_tags
+        shipped, unshipped = _partition_by_shipped(builds, mock.MagicMock())
+        self.assertEqual([b["id"] for b in shipped], [13, 14, 16])
+        self.assertEqual([b["id"] for b in unshipped], [11, 12, 15])
+        get_builds_tags.assert_called_once_with(build_ids, mock.ANY)
+        self.assertEqual(builds[1]["_tags"], {"bar-candidate", "bar-released"})
+
+        get_builds_tags.reset_mock()
+        shipped, unshipped = _partition_by_shipped(builds, mock.MagicMock(), include_shipped=True)
+        self.assertEqual(shipped, [])
+        self.assertEqual(unshipped, builds)
+        get_builds_tags.assert_not_called()
+
+    def test_ensure_accepted_tags(self):
+        tag_pv_map = {"rhaos-4.14-rhel-8-candidate": "OSE-4.14-RHEL-8", "rhaos-4.14-rhel-9-candidate": "OSE-4.14-RHEL-9"}
+        builds = [
+            {"nvr": "a-1.0-1.el8", "_tags": {"foo", "rhaos-4.14-rhel-8-candidate"}},
+            {"nvr": "b-1.0-1.el9", "tag_name": "rhaos-4.14-rhel-9-candidate"},
+            {"nvr": "c-1.0-1.el8", "_tags": {"foo"}},
+        ]
+        _ensure_accepted_tags(builds, mock.MagicMock(), tag_pv_map, raise_exception=False)
+        self.assertEqual(builds[0]["tag_name"], "rhaos-4.14-rhel-8-candidate")
+        self.assertEqual(builds[1]["tag_name"], "rhaos-4.14-rhel-9-candidate")
+        self.assertNotIn("tag_name", builds[2])
+        with self.assertRaises(IOError):
+            _ensure_accepted_tags(builds, mock.MagicMock(), tag_pv_map)
+
+    @mock.patch("elliottlib.cli.find_builds_cli.BuildFinder")
+    def test_find_rpm_builds_in_tag(self, BuildFinder: mock.MagicMock):
+        runtime = mock.MagicMock(assembly_basis_event=None, brew_event=None)
+        koji_api = runtime.pooled_koji_client_session.return_value.__enter__.return_value
+        builder = BuildFinder.return_value
+        builder.from_tag.return_value = {"a": {"id": 1, "nvr": "a-1.0-1.el8"}}
+        actual = find_builds_cli._find_rpm_builds_in_tag(runtime, "rhaos-4.14-rhel-8-candidate", "stream", {}, {})
+        self.assertEqual(actual, [{"id": 1, "nvr": "a-1.0-1.el8"}])
+        BuildFinder.assert_called_once_with(koji_api, logger=mock.ANY)
+        builder.from_tag.assert_called_once_with("rpm", "rhaos-4.14-rhel-8-candidate", inherit=False, assembly="stream", event=None)
+
+        # with an assembly basis event, tags that are not specific to a RHEL version are skipped
+        runtime.assembly_basis_event = 123
+        self.assertEqual(find_builds_cli._find_rpm_builds_in_tag(runtime, "rhaos-4.14-candidate", "stream", {}, {}), [])
+        builder.from_pinned_by_is.assert_not_called()
+
+    def test_json_dump(self):
+        tag_pv_map = {"rhaos-4.14-rhel-8-candidate": "OSE-4.14-RHEL-8", "rhaos-4.14-rhel-9-candidate": "OSE-4.14-RHEL-9"}
+        builds = [
+            Build(nvr="b-1.0-1.el9", product_version="OSE-4.14-RHEL-9"),
+            Build(nvr="a-1.0-1.el8", product_version="OSE-4.14-RHEL-8"),
+        ]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            output = os.path.join(tmpdir, "builds.json")
+            find_builds_cli._json_dump(output, builds, "rpm", tag_pv_map)
+            with open(output) as f:
+                actual = json.load(f)
+        self.assertEqual(actual, {
+            "builds": ["a-1.0-1.el8", "b-1.0-1.el9"],
+            "base_tag": ["rhaos-4.14-rhel-8-candidate", "rhaos-4.14-rhel-9-candidate"],
+            "kind": "rpm",
+        })
+
+
+class TestFindBuildsCliAsync(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        find_builds_cli._errata_release_version.cache_clear()
+
+    async def test_filter_out_attached_builds_inviable(self):
         metadata = json.loads('''{"release": "4.1", "kind": "rpm", "impetus": "cve"}''')
         flexmock(erratalib).should_receive("get_metadata_comments_json").and_return([metadata])
 
         builds = flexmock(Build(nvr="test-1.1.1", product_version="RHEL-7-OSE-4.1"))
         builds.should_receive("all_errata").and_return([{"id": 12345}])
 
-        builds, advisories = _filter_out_attached_builds([builds])
+        builds, advisories = await _filter_out_attached_builds([builds])
         self.assertEqual([], builds)
         self.assertEqual({12345}, advisories)
 
-    def test_filter_out_attached_builds_viable(self):
+    async def test_filter_out_attached_builds_viable(self):
         metadata = json.loads('''{"release": "4.1", "kind": "rpm", "impetus": "cve"}''')
         flexmock(erratalib).should_receive("get_metadata_comments_json").and_return([metadata])
 
         builds = flexmock(Build(nvr="test-1.1.1", product_version="RHEL-7-OSE-4.5"))
         builds.should_receive("all_errata").and_return([{"id": 12345}])
 
-        builds, advisories = _filter_out_attached_builds([builds])
+        builds, advisories = await _filter_out_attached_builds([builds])
         self.assertEqual([Build("test-1.1.1")], builds)
         self.assertEqual(set(), advisories)
 
-    @mock.patch("elliottlib.brew.get_builds_tags")
-    def test_find_shipped_builds(self, get_builds_tags: mock.MagicMock):
-        build_ids = [11, 12, 13, 14, 15]
-        build_tags = [
-            [{"name": "foo-candidate"}],
-            [{"name": "bar-candidate"}, {"name": "bar-released"}],
-            [{"name": "bar-candidate"}, {"name": "RHBA-2077:1001-released"}],
-            [{"name": "bar-candidate"}, {"name": "RHSA-2077:1002-released"}],
-            [],
-        ]
-        get_builds_tags.return_value = build_tags
-        expected = {13, 14}
-        actual = _find_shipped_builds(build_ids, mock.MagicMock())
-        self.assertEqual(expected, actual)
-        get_builds_tags.assert_called_once_with(build_ids, mock.ANY)
+    async def test_filter_out_attached_builds_fetches_each_advisory_once(self):
+        metadata = json.loads('''{"release": "4.1", "kind": "rpm", "impetus": "cve"}''')
+        flexmock(erratalib).should_receive("get_metadata_comments_json").with_args(12345).once().and_return([metadata])
+        flexmock(erratalib).should_receive("get_metadata_comments_json").with_args(12346).once().and_return([])
+
+        build1 = flexmock(Build(nvr="test-1.1.1", product_version="RHEL-7-OSE-4.1"))
+        build1.should_receive("all_errata").and_return([{"id": 12346}, {"id": 12345}])
+        build2 = flexmock(Build(nvr="test-1.1.2", product_version="RHEL-7-OSE-4.1"))
+        build2.should_receive("all_errata").and_return([{"id": 12345}])
+
+        builds, advisories = await _filter_out_attached_builds([build1, build2])
+        self.assertEqual([], builds)
+        self.assertEqual({12345}, advisories)
+
+    async def test_fetch_errata_builds(self):
+        errata_api = mock.AsyncMock()
+        errata_api.get_build.side_effect = lambda nvr: {"id": hash(nvr), "all_errata": []}
+        nvrps = [("a", "1.0", "1", "RHEL-8-OSE-4.14"), ("b", "2.0", "1", "RHEL-9-OSE-4.14")]
+        actual = await _fetch_errata_builds(errata_api, nvrps)
+        self.assertEqual([b.nvr for b in actual], ["a-1.0-1", "b-2.0-1"])
+        self.assertEqual([b.product_version for b in actual], ["RHEL-8-OSE-4.14", "RHEL-9-OSE-4.14"])
+        errata_api.get_build.assert_has_awaits([mock.call("a-1.0-1"), mock.call("b-2.0-1")])
+
+    @mock.patch("elliottlib.cli.find_builds_cli.get_build_id_from_rhcos_pullspec")
+    @mock.patch("elliottlib.cli.find_builds_cli.get_container_configs")
+    @mock.patch("elliottlib.cli.find_builds_cli.assembly_rhcos_config")
+    async def test_get_rhcos_nvrs_from_assembly(self, assembly_rhcos_config, get_container_configs, get_build_id):
+        assembly_rhcos_config.return_value = {
+            "machine-os-content": {"images": {"x86_64": "quay.io/a@sha256:1", "s390x": "quay.io/b@sha256:2"}},
+            "rhel-coreos": {"images": {"x86_64": "quay.io/c@sha256:3"}},
+            "dependencies": {"rpms": []},
+        }
+        get_container_configs.return_value = [{"name": "machine-os-content"}, {"name": "rhel-coreos"}]
+        get_build_id.side_effect = lambda pullspec, _: "414.92.1" if pullspec != "quay.io/b@sha256:2" else "414.92.2"
+        brew_session = mock.MagicMock()
+        multicall = brew_session.multicall.return_value.__enter__.return_value
+        multicall.getBuild.side_effect = lambda nvr: mock.Mock(result={"nvr": nvr} if nvr != "rhcos-s390x-414.92.2" else None)
+
+        actual = await find_builds_cli.get_rhcos_nvrs_from_assembly(mock.MagicMock(), brew_session)
+        self.assertEqual(actual, ["rhcos-x86_64-414.92.1"])
+        self.assertEqual(get_build_id.call_count, 3)
+        self.assertEqual(multicall.getBuild.call_count, 2)
 
 
 if __name__ == "__main__":